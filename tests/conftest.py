@@ -37,3 +37,32 @@ pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+import pytest
+
+
+@pytest.fixture(scope='session', autouse=True)
+def isolated_files():
+    """Кэш, метрики и журналы - во временном каталоге, а не в cache/;
+    миниатюры готовятся сразу, а не в фоне после конца теста."""
+    from core.testing import IsolatedFiles
+
+    files = IsolatedFiles()
+    files.enable()
+    yield
+    files.disable()
+
+
+@pytest.fixture
+def query_budget(db):
+    """Бюджет SQL-запросов блока: query_budget('posts:index') берёт
+    бюджет страницы из posts/budgets.py, query_budget(3) - явный."""
+    from core.querybudget import QueryBudget
+    from posts.budgets import budget_for
+
+    def make(limit):
+        if isinstance(limit, str):
+            return budget_for(limit)
+        return QueryBudget(limit)
+    return make
@@ -0,0 +1,41 @@
+import pytest
+from django.core.cache import cache
+from django.test import Client
+
+from core.querybudget import QueryBudgetExceeded
+from posts import benchmark, urls
+from posts.budgets import QUERY_BUDGETS
+
+
+class TestQueryBudget:
+
+    def test_every_url_has_budget(self):
+        assert set(QUERY_BUDGETS) == {
+            pattern.name for pattern in urls.urlpatterns
+        }, 'Проверьте, что у каждого адреса posts/urls.py есть бюджет запросов'
+
+    @pytest.mark.django_db
+    def test_pages_within_budget(self, user_client, query_budget,
+                                 few_posts_with_group,
+                                 another_few_posts_with_group_with_follower):
+        targets = benchmark.targets()
+        assert {name for name, _ in targets} == set(QUERY_BUDGETS), (
+            'Проверьте, что обходятся все адреса posts/urls.py'
+        )
+        for name, url in targets:
+            for client in (Client(), user_client):
+                cache.clear()
+                with query_budget(f'posts:{name}'):
+                    response = client.get(url)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+
+    @pytest.mark.django_db
+    def test_report_lists_duplicated_sql(self, query_budget, user):
+        with pytest.raises(QueryBudgetExceeded) as info:
+            with query_budget(1):
+                for _ in range(3):
+                    type(user).objects.filter(pk=user.pk).exists()
+        message = str(info.value)
+        assert 'Блок: 3 запросов при бюджете 1' in message
+        assert '3 x SELECT' in message
@@ -0,0 +1,68 @@
+import os
+
+from django.contrib import admin
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from . import profiling
+from .models import RequestProfile
+
+
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('created', 'view', 'method', 'path', 'status',
+                    'duration', 'trigger', 'user')
+    list_filter = ('view', 'trigger', 'created')
+    search_fields = ('path',)
+    list_select_related = ('user',)
+    fields = ('created', 'view', 'method', 'path', 'status', 'duration',
+              'trigger', 'user', 'download', 'summary')
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/download/',
+                 self.admin_site.admin_view(self.download_view),
+                 name='core_requestprofile_download'),
+        ] + super().get_urls()
+
+    def download_view(self, request, pk):
+        if not self.has_view_permission(request):
+            raise Http404
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        try:
+            file = open(os.path.join(profiling.directory(), profile.file),
+                        'rb')
+        except FileNotFoundError:
+            raise Http404
+        return FileResponse(file, as_attachment=True, filename=profile.file)
+
+    def download(self, obj):
+        url = reverse('admin:core_requestprofile_download', args=[obj.pk])
+        return format_html('<a href="{}">{}</a>', url, obj.file)
+    download.short_description = 'Файл .prof'
+
+    def summary(self, obj):
+        text = profiling.summary(obj.file)
+        return format_html('<pre>{}</pre>', text or 'Файл профиля удалён')
+    summary.short_description = (
+        f'Первые {profiling.TOP} функций по cumulative-времени')
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        profiling.delete_files([obj.file])
+
+    def delete_queryset(self, request, queryset):
+        names = list(queryset.values_list('file', flat=True))
+        super().delete_queryset(request, queryset)
+        profiling.delete_files(names)
+
+
+admin.site.register(RequestProfile, RequestProfileAdmin)
@@ -1,5 +1,11 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from . import replicas, slowlog
+        connection_created.connect(slowlog.install)
+        connection_created.connect(replicas.install)
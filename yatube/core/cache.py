@@ -0,0 +1,275 @@
+"""Кэш в SQLite-файле, общий для всех процессов на машине.
+
+Файл открывается в режиме WAL: читатели не ждут писателей, а все
+WSGI-процессы видят одни и те же записи. Размер кэша ограничен
+OPTIONS['MAX_SIZE'] байтами, при переполнении вытесняются записи,
+к которым дольше всего не обращались (LRU).
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.SQLiteCache',
+            'LOCATION': '/var/tmp/yatube/cache.sqlite3',
+            'OPTIONS': {'MAX_SIZE': 64 * 1024 * 1024},
+        }
+    }
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from core import metrics, timing
+
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS cache (
+        key TEXT PRIMARY KEY,
+        value BLOB NOT NULL,
+        expires REAL,
+        accessed REAL NOT NULL,
+        size INTEGER NOT NULL
+    ) WITHOUT ROWID''',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    '''CREATE TABLE IF NOT EXISTS cache_size (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        total INTEGER NOT NULL
+    )''',
+    'INSERT OR IGNORE INTO cache_size VALUES (0, 0)',
+    '''CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache
+    BEGIN
+        UPDATE cache_size SET total = total + NEW.size;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size ON cache
+    BEGIN
+        UPDATE cache_size SET total = total - OLD.size + NEW.size;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache
+    BEGIN
+        UPDATE cache_size SET total = total - OLD.size;
+    END''',
+)
+
+UPSERT = '''
+    INSERT INTO cache (key, value, expires, accessed, size)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (key) DO UPDATE SET
+        value = excluded.value,
+        expires = excluded.expires,
+        accessed = excluded.accessed,
+        size = excluded.size
+'''
+
+# SQLite ограничивает число параметров в одном запросе
+CHUNK_SIZE: int = 500
+
+
+class SQLiteCache(BaseCache):
+    """Django-кэш в общем SQLite-файле с LRU-вытеснением по размеру."""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._max_size = int(options.get('MAX_SIZE', 64 * 1024 * 1024))
+        # Время последнего обращения обновляется не чаще раза в секунду,
+        # чтобы чтение почти никогда не превращалось в запись
+        self._touch_interval = float(options.get('TOUCH_INTERVAL', 1))
+        self._busy_timeout = float(options.get('BUSY_TIMEOUT', 5))
+        self._local = threading.local()
+
+    @property
+    def _db(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(
+                self._path,
+                timeout=self._busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            with _transaction(db):
+                for statement in SCHEMA:
+                    db.execute(statement)
+            local.db, local.pid = db, os.getpid()
+        return local.db
+
+    def _load(self, rows, now):
+        """Живые значения из строк выборки; отмечает обращение к ним."""
+        found, touched = {}, []
+        for key, value, expires, accessed in rows:
+            if expires is not None and expires <= now:
+                continue
+            found[key] = pickle.loads(value)
+            if now - accessed > self._touch_interval:
+                touched.append((now, key))
+        if touched:
+            try:
+                self._db.executemany(
+                    'UPDATE cache SET accessed = ? WHERE key = ?', touched)
+            except sqlite3.OperationalError:
+                # Отметка для LRU не стоит ожидания блокировки
+                pass
+        return found
+
+    def _select(self, keys):
+        db = self._db
+        for start in range(0, len(keys), CHUNK_SIZE):
+            chunk = keys[start:start + CHUNK_SIZE]
+            yield from db.execute(
+                'SELECT key, value, expires, accessed FROM cache '
+                f'WHERE key IN ({",".join("?" * len(chunk))})', chunk)
+
+    def _row(self, key, value, timeout, now):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        return (key, data, self.get_backend_timeout(timeout), now,
+                len(key) + len(data))
+
+    def _cull(self, db):
+        """Удаляет просроченные, затем самые давние записи сверх лимита."""
+        (total,) = db.execute('SELECT total FROM cache_size').fetchone()
+        if total <= self._max_size:
+            return
+        db.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        while True:
+            (total,) = db.execute('SELECT total FROM cache_size').fetchone()
+            if total <= self._max_size:
+                return
+            (count,) = db.execute('SELECT count(*) FROM cache').fetchone()
+            if not count:
+                return
+            db.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                'ORDER BY accessed LIMIT ?)',
+                (max(1, count // self._cull_frequency),))
+
+    @timing.phase('cache')
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        found = self._load(self._select([key]), time.time())
+        metrics.count_cache(len(found), 1 - len(found))
+        return found.get(key, default)
+
+    @timing.phase('cache')
+    def get_many(self, keys, version=None):
+        keymap = {}
+        for key in keys:
+            made = self.make_key(key, version=version)
+            self.validate_key(made)
+            keymap[made] = key
+        if not keymap:
+            return {}
+        found = self._load(self._select(list(keymap)), time.time())
+        metrics.count_cache(len(found), len(keymap) - len(found))
+        return {keymap[key]: value for key, value in found.items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout=timeout, version=version)
+
+    @timing.phase('cache')
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        rows = []
+        for key, value in data.items():
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            rows.append(self._row(key, value, timeout, now))
+        db = self._db
+        with _transaction(db):
+            db.executemany(UPSERT, rows)
+            self._cull(db)
+        return []
+
+    @timing.phase('cache')
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        db = self._db
+        with _transaction(db):
+            row = db.execute(
+                'SELECT expires FROM cache WHERE key = ?', (key,)
+            ).fetchone()
+            if row and (row[0] is None or row[0] > now):
+                return False
+            db.execute(UPSERT, self._row(key, value, timeout, now))
+            self._cull(db)
+        return True
+
+    @timing.phase('cache')
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        db = self._db
+        with _transaction(db):
+            row = db.execute(
+                'SELECT value, expires FROM cache WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] <= now):
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            db.execute(
+                'UPDATE cache SET value = ?, accessed = ?, size = ? '
+                'WHERE key = ?', (data, now, len(key) + len(data), key))
+        return value
+
+    @timing.phase('cache')
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        cursor = self._db.execute(
+            'UPDATE cache SET expires = ?, accessed = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), now, key, now))
+        return cursor.rowcount > 0
+
+    @timing.phase('cache')
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        row = self._db.execute(
+            'SELECT 1 FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)', (key, time.time())
+        ).fetchone()
+        return row is not None
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    @timing.phase('cache')
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        db = self._db
+        with _transaction(db):
+            for start in range(0, len(keys), CHUNK_SIZE):
+                chunk = keys[start:start + CHUNK_SIZE]
+                db.execute(
+                    f'DELETE FROM cache WHERE key IN '
+                    f'({",".join("?" * len(chunk))})', chunk)
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
+
+
+class _transaction:
+    """BEGIN IMMEDIATE ... COMMIT: изменения атомарны между процессами."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        return self.db
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
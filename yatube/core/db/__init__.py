@@ -0,0 +1,2 @@
+"""Бэкенд SQLite с настройками для боевой нагрузки: ENGINE 'core.db'."""
+from .base import write_atomic  # noqa: F401
@@ -0,0 +1,99 @@
+"""SQLite для нескольких процессов: WAL, BEGIN IMMEDIATE и повторы.
+
+В журнале WAL читатели не ждут писателя. Транзакции write_atomic
+начинаются с BEGIN IMMEDIATE: блокировка записи берётся сразу,
+а не при первой записи, поэтому писатели ждут друг друга в
+busy_timeout, а не падают с 'database is locked' посреди транзакции.
+Если блокировку не удалось получить и за busy_timeout, BEGIN
+повторяется ещё begin_retries раз с растущей паузой. Обычный atomic
+начинается с BEGIN и не мешает другим писателям, пока не пишет сам.
+
+Кроме обычных параметров sqlite3.connect OPTIONS принимают pragmas
+(дополняют и заменяют PRAGMAS), begin_retries и retry_backoff (с).
+"""
+import itertools
+import random
+import time
+
+from django.db import DEFAULT_DB_ALIAS, OperationalError, transaction
+from django.db.backends.sqlite3 import base
+from django.db.backends.sqlite3.base import Database
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    # отрицательный cache_size - в КиБ: 64 МиБ страниц на соединение
+    'cache_size': -64 * 1024,
+    'mmap_size': 256 * 1024 * 1024,
+}
+BEGIN_RETRIES = 3
+RETRY_BACKOFF = 0.05
+
+
+def configure(connection, pragmas=PRAGMAS):
+    for name, value in pragmas.items():
+        connection.execute(f'PRAGMA {name} = {value}')
+
+
+def is_locked(exc):
+    message = str(exc)
+    return 'locked' in message or 'busy' in message
+
+
+def with_retry(begin, retries=BEGIN_RETRIES, backoff=RETRY_BACKOFF):
+    """Вызывает begin(), повторяя при занятой базе с паузой backoff * 2**n."""
+    for attempt in itertools.count():
+        try:
+            return begin()
+        except (Database.OperationalError, OperationalError) as exc:
+            if attempt >= retries or not is_locked(exc):
+                raise
+            time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+class WriteAtomic(transaction.Atomic):
+    """atomic, внешний BEGIN которого - BEGIN IMMEDIATE."""
+
+    def __enter__(self):
+        connection = transaction.get_connection(self.using)
+        immediate = getattr(connection, 'immediate', False)
+        connection.immediate = True
+        try:
+            super().__enter__()
+        finally:
+            connection.immediate = immediate
+
+
+def write_atomic(using=None, savepoint=True):
+    """transaction.atomic для блоков, которые пишут в базу.
+
+    Внутри уже открытой транзакции ничего не меняет: её тип выбран
+    внешним блоком.
+    """
+    if callable(using):
+        return WriteAtomic(DEFAULT_DB_ALIAS, savepoint)(using)
+    return WriteAtomic(using, savepoint)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    immediate = False
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.pragmas = {**PRAGMAS, **kwargs.pop('pragmas', {})}
+        self.begin_retries = kwargs.pop('begin_retries', BEGIN_RETRIES)
+        self.retry_backoff = kwargs.pop('retry_backoff', RETRY_BACKOFF)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        configure(conn, self.pragmas)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if not self.immediate:
+            return super()._start_transaction_under_autocommit()
+        cursor = self.cursor()
+        with_retry(lambda: cursor.execute('BEGIN IMMEDIATE'),
+                   self.begin_retries, self.retry_backoff)
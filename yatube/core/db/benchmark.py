@@ -0,0 +1,120 @@
+"""Конкурентные чтения и записи SQLite до и после настроек core.db.
+
+Процессы-писатели повторяют транзакцию, похожую на add_comment:
+прочитать пост, добавить комментарий, увеличить счётчик. Читатели
+в это время листают ленту. Профиль default - как у стандартного
+бэкенда Django: журнал отката и отложенный BEGIN; tuned - PRAGMAS,
+BEGIN IMMEDIATE и повторы из core.db.base. Каждый профиль работает
+со своим временным файлом базы.
+"""
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .base import configure, with_retry
+
+PROFILES = ('default', 'tuned')
+# Время ожидания блокировки, как у sqlite3.connect по умолчанию
+TIMEOUT = 5
+
+SCHEMA = '''
+    CREATE TABLE post (
+        id INTEGER PRIMARY KEY,
+        text TEXT NOT NULL,
+        comments_count INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE comment (
+        id INTEGER PRIMARY KEY,
+        post_id INTEGER NOT NULL REFERENCES post (id),
+        text TEXT NOT NULL
+    );
+    CREATE INDEX comment_post ON comment (post_id);
+'''
+
+
+def connect(path, profile):
+    db = sqlite3.connect(path, timeout=TIMEOUT, isolation_level=None)
+    if profile == 'tuned':
+        configure(db)
+    return db
+
+
+def prepare(path, profile, posts):
+    db = connect(path, profile)
+    db.executescript(SCHEMA)
+    db.execute('BEGIN')
+    db.executemany('INSERT INTO post (text) VALUES (?)',
+                   ((f'Пост {i} ' * 20,) for i in range(posts)))
+    db.execute('COMMIT')
+    db.close()
+
+
+def write(db, profile, posts):
+    begin = 'BEGIN IMMEDIATE' if profile == 'tuned' else 'BEGIN'
+    if profile == 'tuned':
+        with_retry(lambda: db.execute(begin))
+    else:
+        db.execute(begin)
+    try:
+        post_id = random.randint(1, posts)
+        db.execute('SELECT id, text FROM post WHERE id = ?',
+                   (post_id,)).fetchone()
+        db.execute('INSERT INTO comment (post_id, text) VALUES (?, ?)',
+                   (post_id, 'Комментарий'))
+        db.execute('UPDATE post SET comments_count = comments_count + 1 '
+                   'WHERE id = ?', (post_id,))
+        db.execute('COMMIT')
+    except sqlite3.Error:
+        db.execute('ROLLBACK')
+        raise
+
+
+def read(db, profile, posts):
+    offset = random.randint(0, max(posts - 10, 0))
+    db.execute('SELECT id, text, comments_count FROM post '
+               'ORDER BY id DESC LIMIT 10 OFFSET ?', (offset,)).fetchall()
+
+
+def worker(path, profile, role, seconds, posts):
+    """(операций, ошибок блокировки) одного процесса за seconds."""
+    db = connect(path, profile)
+    action = write if role == 'write' else read
+    done = errors = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        try:
+            action(db, profile, posts)
+            done += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    db.close()
+    return done, errors
+
+
+def run_profile(profile, readers, writers, seconds, posts):
+    """{'read'/'write': (операций в секунду, ошибок)} одного профиля."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.sqlite3')
+        prepare(path, profile, posts)
+        roles = ['read'] * readers + ['write'] * writers
+        with ProcessPoolExecutor(max_workers=len(roles)) as pool:
+            futures = [
+                (role, pool.submit(worker, path, profile, role, seconds,
+                                   posts))
+                for role in roles
+            ]
+            totals = {'read': [0, 0], 'write': [0, 0]}
+            for role, future in futures:
+                done, errors = future.result()
+                totals[role][0] += done
+                totals[role][1] += errors
+    return {role: (done / seconds, errors)
+            for role, (done, errors) in totals.items()}
+
+
+def run(readers=4, writers=4, seconds=5.0, posts=2000):
+    return {profile: run_profile(profile, readers, writers, seconds, posts)
+            for profile in PROFILES}
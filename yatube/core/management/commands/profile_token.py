@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core import profiling
+
+
+class Command(BaseCommand):
+    help = 'Выдаёт токен для заголовка X-Profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--note', default='',
+                            help='Пометка в токене: кто и зачем профилирует')
+
+    def handle(self, *args, **options):
+        self.stdout.write(profiling.make_token(options['note']))
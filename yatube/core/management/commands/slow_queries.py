@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from core import slowlog
+
+
+class Command(BaseCommand):
+    help = 'Показывает самые тяжёлые отпечатки SQL из журнала'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--order', choices=slowlog.ORDERS,
+                            default='total',
+                            help='Сортировка: общее время, максимум '
+                                 'или число вызовов')
+        parser.add_argument('--clear', action='store_true',
+                            help='Очистить журнал')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            slowlog.log.clear()
+            self.stdout.write(self.style.SUCCESS('Журнал очищен'))
+            return
+        rows = slowlog.log.top(options['limit'], options['order'])
+        for view, sql, calls, requests, total, longest, plan in rows:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{view}: {calls} вызовов в {requests} ответах, '
+                f'всего {total * 1000:.1f} мс, '
+                f'максимум {longest * 1000:.1f} мс'))
+            self.stdout.write(sql)
+            if plan:
+                self.stdout.write(plan)
+            self.stdout.write('')
+        if not rows:
+            self.stdout.write('Медленных запросов нет')
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from core.db import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает конкурентные чтения и записи SQLite '
+            'со стандартными настройками и с core.db')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--posts', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        results = benchmark.run(options['readers'], options['writers'],
+                                options['seconds'], options['posts'])
+        self.stdout.write(f'{"профиль":<10}{"чтений/с":>12}{"ошибок":>8}'
+                          f'{"записей/с":>12}{"ошибок":>8}')
+        for profile, result in results.items():
+            reads, read_errors = result['read']
+            writes, write_errors = result['write']
+            self.stdout.write(f'{profile:<10}{reads:>12.0f}{read_errors:>8}'
+                              f'{writes:>12.0f}{write_errors:>8}')
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import replicas
+
+
+class Command(BaseCommand):
+    help = 'Копирует основную базу в реплики для чтения лент'
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*',
+                            help='Реплики, по умолчанию DATABASE_REPLICAS')
+        parser.add_argument('--interval', type=float,
+                            help='Повторять синхронизацию раз в столько '
+                                 'секунд, пока команду не остановят')
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or replicas.replicas()
+        unknown = set(aliases) - set(replicas.replicas())
+        if unknown:
+            raise CommandError(
+                f'Не реплики: {", ".join(sorted(unknown))}')
+        while True:
+            for alias in aliases:
+                started = time.monotonic()
+                replicas.sync(alias)
+                self.stdout.write(
+                    f'{alias}: {(time.monotonic() - started) * 1000:.0f} мс')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,263 @@
+"""Метрики запросов по представлениям в формате Prometheus.
+
+MetricsMiddleware замеряет каждый ответ: время, число и время
+SQL-запросов, попадания и промахи кэша, размер ответа. Наблюдения
+копятся в памяти процесса и раз в METRICS_FLUSH_INTERVAL секунд
+складываются в общий SQLite-файл METRICS_PATH, поэтому страница
+/metrics показывает сумму по всем WSGI-процессам машины.
+"""
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (1024, 10240, 51200, 102400, 512000, 1048576)
+
+HISTOGRAMS = {
+    'yatube_request_duration_seconds': (
+        'Время ответа', LATENCY_BUCKETS),
+    'yatube_db_query_duration_seconds': (
+        'Суммарное время SQL-запросов ответа', LATENCY_BUCKETS),
+    'yatube_db_queries': (
+        'Число SQL-запросов ответа', QUERY_BUCKETS),
+    'yatube_response_size_bytes': (
+        'Размер ответа', SIZE_BUCKETS),
+}
+COUNTERS = {
+    'yatube_cache_hits_total': 'Попадания в кэш',
+    'yatube_cache_misses_total': 'Промахи кэша',
+}
+
+SCHEMA = '''CREATE TABLE IF NOT EXISTS samples (
+    metric TEXT NOT NULL,
+    view TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (metric, view, bucket)
+) WITHOUT ROWID'''
+
+UPSERT = '''
+    INSERT INTO samples (metric, view, bucket, value) VALUES (?, ?, ?, ?)
+    ON CONFLICT (metric, view, bucket) DO UPDATE SET
+        value = value + excluded.value
+'''
+
+UNRESOLVED = '<unresolved>'
+
+
+class Store:
+    """Счётчики в памяти процесса со сбросом в общий SQLite-файл.
+
+    Для гистограмм хранится число наблюдений в каждом интервале
+    (не накопительно), их сумма и количество.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._flushed = time.monotonic()
+        self._local = threading.local()
+
+    @property
+    def path(self):
+        return getattr(settings, 'METRICS_PATH', None) or os.path.join(
+            settings.BASE_DIR, 'cache', 'metrics.sqlite3')
+
+    @property
+    def _db(self):
+        local, path = self._local, self.path
+        if getattr(local, 'key', None) != (os.getpid(), path):
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(path, timeout=5, isolation_level=None,
+                                 check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute(SCHEMA)
+            local.db, local.key = db, (os.getpid(), path)
+        return local.db
+
+    def _add(self, metric, view, bucket, value):
+        key = (metric, view, bucket)
+        self._pending[key] = self._pending.get(key, 0) + value
+
+    def observe(self, metric, view, value):
+        _, buckets = HISTOGRAMS[metric]
+        bucket = next((str(le) for le in buckets if value <= le), '+Inf')
+        with self._lock:
+            self._add(metric, view, bucket, 1)
+            self._add(metric, view, 'sum', value)
+            self._add(metric, view, 'count', 1)
+
+    def increment(self, metric, view, value=1):
+        with self._lock:
+            self._add(metric, view, '', value)
+
+    def flush(self, force=False):
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 1)
+        with self._lock:
+            if not force and time.monotonic() - self._flushed < interval:
+                return
+            pending, self._pending = self._pending, {}
+            self._flushed = time.monotonic()
+        if not pending:
+            return
+        rows = [(*key, value) for key, value in pending.items()]
+        try:
+            db = self._db
+            db.execute('BEGIN IMMEDIATE')
+            db.executemany(UPSERT, rows)
+            db.execute('COMMIT')
+        except sqlite3.Error:
+            # Метрики не должны ронять ответы: вернём их в очередь
+            with self._lock:
+                for metric, view, bucket, value in rows:
+                    self._add(metric, view, bucket, value)
+
+    def samples(self):
+        self.flush(force=True)
+        return self._db.execute(
+            'SELECT metric, view, bucket, value FROM samples '
+            'ORDER BY metric, view').fetchall()
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus 0.0.4."""
+        values = {}
+        for metric, view, bucket, value in self.samples():
+            values.setdefault(metric, {}).setdefault(view, {})[bucket] = value
+        lines = []
+        for metric, (help_text, buckets) in HISTOGRAMS.items():
+            lines += [f'# HELP {metric} {help_text}',
+                      f'# TYPE {metric} histogram']
+            for view, data in values.get(metric, {}).items():
+                label = f'view="{_escape(view)}"'
+                total = 0
+                for le in (*map(str, buckets), '+Inf'):
+                    total += data.get(le, 0)
+                    lines.append(
+                        f'{metric}_bucket{{{label},le="{le}"}} {total:g}')
+                lines.append(f'{metric}_sum{{{label}}} {data.get("sum", 0)}')
+                lines.append(
+                    f'{metric}_count{{{label}}} {data.get("count", 0):g}')
+        for metric, help_text in COUNTERS.items():
+            lines += [f'# HELP {metric} {help_text}',
+                      f'# TYPE {metric} counter']
+            for view, data in values.get(metric, {}).items():
+                lines.append(
+                    f'{metric}{{view="{_escape(view)}"}} {data[""]:g}')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._lock:
+            self._pending = {}
+        self._db.execute('DELETE FROM samples')
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+store = Store()
+
+
+class Observation:
+    """Замеры одного запроса."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.size = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Обёртка connection.execute_wrapper
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+    def record(self, view):
+        store.observe('yatube_request_duration_seconds', view,
+                      time.perf_counter() - self.started)
+        store.observe('yatube_db_query_duration_seconds', view, self.db_time)
+        store.observe('yatube_db_queries', view, self.queries)
+        store.observe('yatube_response_size_bytes', view, self.size)
+        if self.cache_hits:
+            store.increment('yatube_cache_hits_total', view, self.cache_hits)
+        if self.cache_misses:
+            store.increment(
+                'yatube_cache_misses_total', view, self.cache_misses)
+        store.flush()
+
+
+current = contextvars.ContextVar('metrics_observation', default=None)
+
+
+def count_cache(hits, misses):
+    """Отмечает обращение к кэшу в замерах текущего запроса."""
+    observation = current.get()
+    if observation is not None:
+        observation.cache_hits += hits
+        observation.cache_misses += misses
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else UNRESOLVED
+
+
+class MetricsMiddleware:
+    """Замеряет ответы и складывает замеры в store по имени представления.
+
+    Должен стоять первым в MIDDLEWARE, чтобы учитывать всю обработку.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def _watch(self, observation):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(observation))
+        return stack
+
+    def __call__(self, request):
+        observation = Observation()
+        token = current.set(observation)
+        try:
+            with self._watch(observation):
+                response = self.get_response(request)
+        finally:
+            current.reset(token)
+        view = view_name(request)
+        if response.streaming:
+            response.streaming_content = self._stream(
+                response.streaming_content, observation, view)
+        else:
+            observation.size = len(response.content)
+            observation.record(view)
+        return response
+
+    def _stream(self, content, observation, view):
+        # Потоковый ответ дописывается уже после выхода из middleware
+        token = current.set(observation)
+        try:
+            with self._watch(observation):
+                for chunk in content:
+                    observation.size += len(chunk)
+                    yield chunk
+        finally:
+            current.reset(token)
+            observation.record(view)
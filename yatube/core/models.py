@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 
 
@@ -11,3 +12,38 @@ class CreatedModel(models.Model):
     class Meta:
         abstract = True
         ordering = ('-created',)
+
+
+class RequestProfile(CreatedModel):
+    """Профиль cProfile одного запроса, файл лежит в PROFILING_DIR."""
+    STAFF = 'staff'
+    HEADER = 'header'
+    SAMPLE = 'sample'
+    TRIGGERS = (
+        (STAFF, 'Сотрудник'),
+        (HEADER, 'Подписанный заголовок'),
+        (SAMPLE, 'Выборка'),
+    )
+
+    view = models.CharField('Представление', max_length=200)
+    method = models.CharField('Метод', max_length=10)
+    path = models.CharField('Адрес', max_length=2000)
+    status = models.PositiveSmallIntegerField('Код ответа')
+    duration = models.FloatField('Время, мс')
+    trigger = models.CharField('Причина', max_length=10, choices=TRIGGERS)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='+',
+        verbose_name='Пользователь'
+    )
+    file = models.CharField('Файл', max_length=100, editable=False)
+
+    class Meta(CreatedModel.Meta):
+        verbose_name = 'профиль запроса'
+        verbose_name_plural = 'профили запросов'
+
+    def __str__(self):
+        return f'{self.method} {self.path}'
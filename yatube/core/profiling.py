@@ -0,0 +1,150 @@
+"""Профилирование отдельных запросов через cProfile.
+
+Запрос профилируется, если сотрудник (is_staff) добавил к адресу
+?profile, если пришёл заголовок X-Profile с подписанным токеном
+(manage.py profile_token) или если запрос попал в случайную выборку
+PROFILING_SAMPLE_RATE. Профиль охватывает представление вместе
+с рендерингом шаблонов; потоковые ответы дописываются уже после
+выхода из middleware и в профиль не попадают.
+
+Файлы .prof (формат pstats, открываются snakeviz и подобными)
+складываются в PROFILING_DIR, хранятся последние PROFILING_KEEP
+штук. Список и сводки по cumulative-времени - в админке.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.db import DatabaseError
+from django.utils import timezone
+
+from .metrics import view_name
+from .models import RequestProfile
+
+QUERY_PARAM = 'profile'
+HEADER = 'HTTP_X_PROFILE'
+SALT = 'core.profiling'
+TOP: int = 40
+
+logger = logging.getLogger(__name__)
+
+
+def directory():
+    return getattr(settings, 'PROFILING_DIR', None) or os.path.join(
+        settings.BASE_DIR, 'cache', 'profiles')
+
+
+def make_token(note=''):
+    """Токен для заголовка X-Profile, действует PROFILING_TOKEN_MAX_AGE."""
+    return signing.dumps(note, salt=SALT)
+
+
+def check_token(token):
+    max_age = getattr(settings, 'PROFILING_TOKEN_MAX_AGE', 3600)
+    try:
+        signing.loads(token, salt=SALT, max_age=max_age)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def trigger(request):
+    """Причина профилировать запрос или None."""
+    if QUERY_PARAM in request.GET and request.user.is_staff:
+        return RequestProfile.STAFF
+    token = request.META.get(HEADER)
+    if token and check_token(token):
+        return RequestProfile.HEADER
+    rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+    if rate and random.random() < rate:
+        return RequestProfile.SAMPLE
+    return None
+
+
+def summary(name, limit=TOP, sort='cumulative'):
+    """Первые limit функций профиля по sort текстом pstats."""
+    path = os.path.join(directory(), name)
+    if not os.path.exists(path):
+        return ''
+    out = io.StringIO()
+    stats = pstats.Stats(path, stream=out)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+def delete_files(names):
+    for name in names:
+        try:
+            os.remove(os.path.join(directory(), name))
+        except FileNotFoundError:
+            pass
+
+
+def rotate(keep=None):
+    """Удаляет профили старше последних keep (PROFILING_KEEP)."""
+    if keep is None:
+        keep = getattr(settings, 'PROFILING_KEEP', 200)
+    stale = list(RequestProfile.objects.order_by(
+        '-created', '-pk').values_list('pk', 'file')[keep:])
+    if not stale:
+        return
+    ids, names = zip(*stale)
+    RequestProfile.objects.filter(pk__in=ids).delete()
+    delete_files(names)
+
+
+def save(profiler, request, response, reason, duration):
+    folder = directory()
+    os.makedirs(folder, exist_ok=True)
+    name = f'{timezone.now():%Y%m%d-%H%M%S-%f}-{os.getpid()}.prof'
+    profiler.dump_stats(os.path.join(folder, name))
+    user = getattr(request, 'user', None)
+    RequestProfile.objects.create(
+        view=view_name(request),
+        method=request.method,
+        path=request.get_full_path()[:2000],
+        status=response.status_code,
+        duration=duration * 1000,
+        trigger=reason,
+        user=user if user is not None and user.is_authenticated else None,
+        file=name,
+    )
+    rotate()
+
+
+class ProfilingMiddleware:
+    """Снимает профиль cProfile с выбранных запросов.
+
+    Ставится после AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        reason = trigger(request)
+        if reason is None:
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # В потоке уже работает другой профилировщик
+            return self.get_response(request)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        duration = time.perf_counter() - started
+        try:
+            save(profiler, request, response, reason, duration)
+        except (OSError, DatabaseError):
+            logger.exception('Не удалось сохранить профиль %s', request.path)
+        return response
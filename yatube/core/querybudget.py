@@ -0,0 +1,62 @@
+"""Бюджет SQL-запросов для тестов: контекстный менеджер и декоратор.
+
+    with QueryBudget(5):
+        client.get(url)
+
+Если запросов больше бюджета, QueryBudgetExceeded (AssertionError)
+перечисляет повторяющиеся отпечатки SQL - обычно это и есть N+1 -
+и все запросы по порядку.
+"""
+from collections import Counter
+from contextlib import ContextDecorator
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+from .slowlog import fingerprint
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def duplicates(queries):
+    """[(число, отпечаток)] для SQL, выполненного больше одного раза."""
+    counts = Counter(fingerprint(query['sql']) for query in queries)
+    return [(count, sql) for sql, count in counts.most_common()
+            if count > 1]
+
+
+def report(queries, limit, label=''):
+    lines = [f'{label or "Блок"}: {len(queries)} запросов '
+             f'при бюджете {limit}']
+    repeated = duplicates(queries)
+    if repeated:
+        lines.append('Повторяются:')
+        lines += [f'  {count} x {sql}' for count, sql in repeated]
+    lines.append('Все запросы:')
+    lines += [f'  {number}. {query["sql"]}'
+              for number, query in enumerate(queries, 1)]
+    return '\n'.join(lines)
+
+
+class QueryBudget(ContextDecorator):
+    """Проверяет, что блок выполнил не больше limit запросов."""
+
+    def __init__(self, limit, using=DEFAULT_DB_ALIAS, label=''):
+        self.limit = limit
+        self.using = using
+        self.label = label
+
+    def __enter__(self):
+        self.context = CaptureQueriesContext(connections[self.using])
+        return self.context.__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.context.__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return
+        queries = self.context.captured_queries
+        if len(queries) > self.limit:
+            raise QueryBudgetExceeded(
+                report(queries, self.limit, self.label))
@@ -0,0 +1,236 @@
+"""Чтение страниц с реплик основной базы.
+
+Реплика - копия default, которую manage.py sync_replica обновляет
+через backup API SQLite. Запись всегда идёт в default, а чтение
+представлений с декоратором read_from_replica уходит на реплику, если:
+
+- запрос GET или HEAD;
+- браузер не закреплён за основной базой: ответ, в котором была
+  запись, ставит подписанную cookie на REPLICA_PIN_SECONDS, и автор
+  сразу видит свой пост или комментарий;
+- реплика отстаёт не больше чем на REPLICA_MAX_LAG секунд: с начала
+  её последней синхронизации в базу не писали или синхронизация
+  началась не раньше REPLICA_MAX_LAG секунд назад.
+
+Счётчик записей (generation) сдвигается после коммита записи, раньше,
+чем версии кэша (posts/caching.py сдвигает их ещё раз после коммита).
+Страницы и фрагменты с реплики кэшируются, только если на реплике
+есть все записи, на которые указывают версии: consistent() сверяет
+счётчик, при котором реплика синхронизирована, с текущим. Отстающая
+реплика отдаёт страницы без кэша и ETag.
+
+Записью считается выполненный INSERT, UPDATE или DELETE в таблицу
+не из PRIMARY_APPS: его отмечает обёртка запросов default
+(advance_after_write).
+
+Сессии, хранилище миниатюр и профили запросов всегда читаются
+из default.
+"""
+import contextvars
+import random
+import re
+import sqlite3
+import time
+from functools import lru_cache, wraps
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+PIN_COOKIE = 'primary_pin'
+SALT = 'core.replicas'
+GENERATION_KEY = 'replica:generation'
+SYNCED_KEY = 'replica:synced:{}'
+# Свежая сессия и готовая миниатюра нужны сразу после записи,
+# служебные записи core (профили запросов) - не данные страниц
+PRIMARY_APPS = ('sessions', 'thumbnail', 'core')
+WRITE = re.compile(
+    r'\s*(?:INSERT\s+(?:OR\s+\w+\s+)?INTO|UPDATE|DELETE\s+FROM)\s+"?(\w+)',
+    re.IGNORECASE)
+
+current = contextvars.ContextVar('replica_routing', default=None)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def generation():
+    """Счётчик записей в базу, общий для всех процессов."""
+    cache.add(GENERATION_KEY, int(time.time() * 1000), None)
+    return cache.get(GENERATION_KEY)
+
+
+def advance():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, int(time.time() * 1000), None)
+
+
+def usable_replicas():
+    """[(реплика, счётчик записей при её синхронизации)] для реплик,
+    которые отстают не больше чем на REPLICA_MAX_LAG секунд."""
+    max_lag = getattr(settings, 'REPLICA_MAX_LAG', 0)
+    keys = {SYNCED_KEY.format(alias): alias for alias in replicas()}
+    found = cache.get_many([GENERATION_KEY, *keys])
+    latest = found.get(GENERATION_KEY)
+    if latest is None:
+        return []
+    now = time.time()
+    usable = []
+    for key, alias in keys.items():
+        if not isinstance(found.get(key), tuple):
+            continue
+        synced, started = found[key]
+        if synced == latest or now - started <= max_lag:
+            usable.append((alias, synced))
+    return usable
+
+
+def copy(source_name, target_name):
+    source = sqlite3.connect(source_name, uri=True)
+    target = sqlite3.connect(target_name, uri=True)
+    try:
+        # Одним шагом: копия - согласованный снимок базы
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def sync(alias):
+    """Копирует default в реплику alias и отмечает её свежей."""
+    synced, started = generation(), time.time()
+    copy(connections[DEFAULT_DB_ALIAS].settings_dict['NAME'],
+         connections[alias].settings_dict['NAME'])
+    cache.set(SYNCED_KEY.format(alias), (synced, started), None)
+
+
+class Routing:
+    """Состояние маршрутизации одного запроса."""
+
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.replica = None
+        self.generation = None
+        self.wrote = False
+
+
+def consistent():
+    """Прочитанное запросом можно кэшировать под прочитанными версиями.
+
+    False, если запрос читает реплику, а после начала её синхронизации
+    в базу записали: версии могли сдвинуться из-за записи, которой
+    на реплике нет.
+    """
+    routing = current.get()
+    if routing is None or routing.replica is None:
+        return True
+    return cache.get(GENERATION_KEY) == routing.generation
+
+
+def read_from_replica(view):
+    """Читает данные представления с одной из свежих реплик."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        routing = current.get()
+        usable = (routing is not None and not routing.pinned
+                  and request.method in ('GET', 'HEAD'))
+        choices = usable_replicas() if usable else []
+        if not choices:
+            return view(request, *args, **kwargs)
+        routing.replica, routing.generation = random.choice(choices)
+        try:
+            response = view(request, *args, **kwargs)
+            if not consistent() and response.has_header('ETag'):
+                # Иначе браузер получал бы 304 на устаревшую страницу
+                del response['ETag']
+            return response
+        finally:
+            routing.replica = None
+    return wrapper
+
+
+@lru_cache(maxsize=None)
+def _primary_tables():
+    return {
+        model._meta.db_table for model in apps.get_models()
+        if model._meta.app_label in PRIMARY_APPS
+    }
+
+
+def advance_after_write(execute, sql, params, many, context):
+    """Отмечает выполненную запись в default.
+
+    Счётчик записей сдвигается, когда запись уже в базе: сразу после
+    запроса в режиме autocommit или после коммита транзакции,
+    а браузер запроса закрепляется за default.
+    """
+    result = execute(sql, params, many, context)
+    match = WRITE.match(sql)
+    if match is None or match.group(1) in _primary_tables():
+        return result
+    routing = current.get()
+    if routing is not None:
+        routing.wrote = True
+    connection = context['connection']
+    if not connection.in_atomic_block:
+        advance()
+    elif not any(func is advance for _, func in connection.run_on_commit):
+        transaction.on_commit(advance, using=connection.alias)
+    return result
+
+
+def install(sender, connection, **kwargs):
+    """Ставит advance_after_write на default (сигнал connection_created)."""
+    if (connection.alias != DEFAULT_DB_ALIAS or not replicas()
+            or advance_after_write in connection.execute_wrappers):
+        return
+    connection.execute_wrappers.insert(0, advance_after_write)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = current.get()
+        if (routing is None or routing.replica is None
+                or model._meta.app_label in PRIMARY_APPS):
+            return None
+        return routing.replica
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Реплики получают схему вместе с данными при синхронизации
+        return False if db in replicas() else None
+
+
+class ReplicaMiddleware:
+    """Закрепляет за основной базой браузер, который только что писал."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+        pinned = request.get_signed_cookie(
+            PIN_COOKIE, default=None, salt=SALT, max_age=pin_seconds)
+        routing = Routing(pinned is not None)
+        token = current.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        if routing.wrote:
+            response.set_signed_cookie(
+                PIN_COOKIE, '1', salt=SALT, max_age=pin_seconds,
+                httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,241 @@
+"""Журнал медленных SQL-запросов с планами EXPLAIN QUERY PLAN.
+
+Обёртка исполнения запросов ставится на каждое соединение с базой
+(сигнал connection_created) и копит время запросов текущего ответа
+по отпечатку - тексту SQL, в котором значения заменены на '?'.
+В конце ответа отпечатки, у которых один запрос или все запросы
+вместе заняли не меньше SLOW_QUERY_THRESHOLD мс, попадают в журнал
+logger'а core.slowlog и в общий SQLite-файл SLOW_QUERY_PATH вместе
+с планом запроса. Поэтому N+1 выглядит одной тяжёлой строкой с
+большим числом вызовов. Сводка - manage.py slow_queries.
+"""
+import contextvars
+import functools
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError
+
+from .metrics import view_name
+
+SCHEMA = '''CREATE TABLE IF NOT EXISTS queries (
+    view TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    calls INTEGER NOT NULL,
+    requests INTEGER NOT NULL,
+    total REAL NOT NULL,
+    max REAL NOT NULL,
+    sample TEXT NOT NULL,
+    plan TEXT NOT NULL,
+    seen REAL NOT NULL,
+    PRIMARY KEY (view, fingerprint)
+) WITHOUT ROWID'''
+
+UPSERT = '''
+    INSERT INTO queries
+        (view, fingerprint, calls, requests, total, max, sample, plan, seen)
+    VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?)
+    ON CONFLICT (view, fingerprint) DO UPDATE SET
+        calls = calls + excluded.calls,
+        requests = requests + 1,
+        total = total + excluded.total,
+        max = max(max, excluded.max),
+        sample = excluded.sample,
+        plan = excluded.plan,
+        seen = excluded.seen
+'''
+
+ORDERS = ('total', 'max', 'calls')
+
+STRING = re.compile(r"'(?:[^']|'')*'")
+NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER = re.compile(r'%s|\?')
+LIST = re.compile(r'\(\?(?:\s*,\s*\?)+\)')
+SPACE = re.compile(r'\s+')
+
+logger = logging.getLogger(__name__)
+
+current = contextvars.ContextVar('slow_query_trace', default=None)
+# EXPLAIN самого журнала не должен в нём оказаться
+explaining = contextvars.ContextVar('slow_query_explaining', default=False)
+
+
+@functools.lru_cache(maxsize=1024)
+def fingerprint(sql):
+    """SQL без конкретных значений: одинаковые запросы совпадают."""
+    sql = STRING.sub('?', sql)
+    sql = NUMBER.sub('?', sql)
+    sql = PLACEHOLDER.sub('?', sql)
+    sql = LIST.sub('(...)', sql)
+    return SPACE.sub(' ', sql).strip()
+
+
+def threshold():
+    """Порог в секундах или None, если журнал выключен."""
+    value = getattr(settings, 'SLOW_QUERY_THRESHOLD', None)
+    return None if value is None else value / 1000
+
+
+def explain(connection, sql, params):
+    """План запроса текстом; для не-SELECT и при ошибке - ''."""
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return ''
+    prefix = ('EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite'
+              else 'EXPLAIN ')
+    token = explaining.set(True)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            rows = cursor.fetchall()
+    except DatabaseError:
+        return ''
+    finally:
+        explaining.reset(token)
+    return '\n'.join(str(row[-1]) for row in rows)
+
+
+class Trace:
+    """Запросы одного ответа, сгруппированные по отпечатку."""
+
+    def __init__(self):
+        self.queries = {}
+
+    def add(self, connection, sql, params, many, seconds):
+        key = fingerprint(sql)
+        entry = self.queries.get(key)
+        if entry is None:
+            self.queries[key] = [1, seconds, seconds, connection, sql,
+                                 None if many else params]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    def heavy(self, limit):
+        """(отпечаток, вызовов, всего, максимум, соединение, sql, params)
+        для отпечатков не легче limit секунд."""
+        return [
+            (key, *entry) for key, entry in self.queries.items()
+            if entry[1] >= limit
+        ]
+
+
+def wrapper(execute, sql, params, many, context):
+    # Обёртка connection.execute_wrapper, стоит на всех соединениях
+    trace = current.get()
+    if trace is None or explaining.get():
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        trace.add(context['connection'], sql, params, many,
+                  time.perf_counter() - started)
+
+
+def install(sender, connection, **kwargs):
+    """Ставит wrapper на новое соединение (сигнал connection_created)."""
+    if threshold() is None or wrapper in connection.execute_wrappers:
+        return
+    # В начало списка: execute_wrapper() снимает последнюю обёртку
+    connection.execute_wrappers.insert(0, wrapper)
+
+
+class Log:
+    """Сводка тяжёлых отпечатков в SQLite-файле, общем для процессов."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    @property
+    def path(self):
+        return getattr(settings, 'SLOW_QUERY_PATH', None) or os.path.join(
+            settings.BASE_DIR, 'cache', 'slow_queries.sqlite3')
+
+    @property
+    def _db(self):
+        local, path = self._local, self.path
+        if getattr(local, 'key', None) != (os.getpid(), path):
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(path, timeout=5, isolation_level=None,
+                                 check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute(SCHEMA)
+            local.db, local.key = db, (os.getpid(), path)
+        return local.db
+
+    def record(self, view, trace):
+        limit = threshold()
+        if limit is None:
+            return
+        rows = []
+        for key, calls, total, longest, connection, sql, params in (
+                trace.heavy(limit)):
+            plan = '' if params is None else explain(connection, sql, params)
+            logger.warning(
+                'Медленный запрос в %s: %d раз, всего %.1f мс, '
+                'максимум %.1f мс\n%s\n%s',
+                view, calls, total * 1000, longest * 1000, key, plan)
+            rows.append((view, key, calls, total, longest, sql, plan,
+                         time.time()))
+        if not rows:
+            return
+        try:
+            self._db.executemany(UPSERT, rows)
+        except sqlite3.Error:
+            logger.exception('Не удалось записать медленные запросы')
+
+    def top(self, limit=20, order='total'):
+        if order not in ORDERS:
+            raise ValueError(f'Неизвестный порядок {order!r}')
+        return self._db.execute(
+            'SELECT view, fingerprint, calls, requests, total, max, plan '
+            f'FROM queries ORDER BY {order} DESC LIMIT ?', (limit,)
+        ).fetchall()
+
+    def clear(self):
+        self._db.execute('DELETE FROM queries')
+
+
+log = Log()
+
+
+class SlowQueryMiddleware:
+    """Собирает запросы ответа и записывает тяжёлые в log.
+
+    Ставится в начало MIDDLEWARE, сразу после MetricsMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if threshold() is None:
+            return self.get_response(request)
+        trace = Trace()
+        token = current.set(trace)
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        if response.streaming:
+            response.streaming_content = self._stream(
+                response.streaming_content, trace, request)
+        else:
+            log.record(view_name(request), trace)
+        return response
+
+    def _stream(self, content, trace, request):
+        token = current.set(trace)
+        try:
+            yield from content
+        finally:
+            current.reset(token)
+            log.record(view_name(request), trace)
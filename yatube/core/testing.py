@@ -0,0 +1,92 @@
+"""Файловые хранилища на время тестов.
+
+Кэш, метрики, журнал медленных запросов, профили и загруженные
+картинки лежат в файлах рядом с проектом. Тесты очищают и заполняют
+их, поэтому и запуск manage.py test (TEST_RUNNER), и pytest
+(tests/conftest.py) уводят их во временный каталог.
+
+Миниатюры в тестах готовятся сразу: потоки фоновой очереди пережили
+бы тестовую базу и писали бы в настоящую. Классу тестов, которому
+нужен свой чистый MEDIA_ROOT, - TempMediaMixin.
+"""
+import copy
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test import override_settings
+from django.test.runner import DiscoverRunner as BaseRunner
+
+from .cache import SQLiteCache
+
+FILE_CACHES = (f'{SQLiteCache.__module__}.{SQLiteCache.__name__}',
+               'django.core.cache.backends.filebased.FileBasedCache')
+
+
+def isolated_settings(directory):
+    """Настройки, которые переносят файловые хранилища в directory."""
+    caches = copy.deepcopy(settings.CACHES)
+    for alias, options in caches.items():
+        if options['BACKEND'] in FILE_CACHES:
+            options['LOCATION'] = os.path.join(directory, f'cache-{alias}')
+    return {
+        'CACHES': caches,
+        'METRICS_PATH': os.path.join(directory, 'metrics.sqlite3'),
+        'SLOW_QUERY_PATH': os.path.join(directory, 'slow_queries.sqlite3'),
+        'PROFILING_DIR': os.path.join(directory, 'profiles'),
+        'MEDIA_ROOT': os.path.join(directory, 'media'),
+        'THUMBNAIL_BACKGROUND': False,
+    }
+
+
+class IsolatedFiles:
+    """Временный каталог с хранилищами: enable() и disable()."""
+
+    def enable(self):
+        self.directory = tempfile.mkdtemp(prefix='yatube-test-')
+        self.override = override_settings(
+            **isolated_settings(self.directory))
+        self.override.enable()
+
+    def disable(self):
+        self.override.disable()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class TempMediaMixin:
+    """MEDIA_ROOT класса тестов - во временном каталоге системы."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp(prefix='yatube-media-')
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+        try:
+            super().setUpClass()
+        except Exception:
+            cls._remove_media()
+            raise
+
+    @classmethod
+    def tearDownClass(cls):
+        try:
+            super().tearDownClass()
+        finally:
+            cls._remove_media()
+
+    @classmethod
+    def _remove_media(cls):
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+
+class DiscoverRunner(BaseRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.isolated_files = IsolatedFiles()
+        self.isolated_files.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.isolated_files.disable()
+        super().teardown_test_environment(**kwargs)
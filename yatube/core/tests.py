@@ -1,4 +1,31 @@
-from django.test import TestCase
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core import profiling, replicas, slowlog
+from core.cache import SQLiteCache
+from core.db import write_atomic
+from core.db.base import DatabaseWrapper
+from core.metrics import Store, store
+from core.models import RequestProfile
+from core.querybudget import QueryBudget, QueryBudgetExceeded
+from posts import caching
+from posts.models import Comment, Post
+
+User = get_user_model()
 
 
 class ViewTestClass(TestCase):
@@ -7,3 +34,518 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         template = 'core/404.html'
         self.assertTemplateUsed(response, template)
+
+
+class SQLiteCacheTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = self.make_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.location, {'OPTIONS': options})
+
+    def test_api(self):
+        """Бэкенд поддерживает основные операции кэша Django."""
+        self.cache.set('a', {'x': 1})
+        self.assertEqual(self.cache.get('a'), {'x': 1})
+        self.assertFalse(self.cache.add('a', 2))
+        self.assertTrue(self.cache.add('b', 2))
+        self.assertEqual(self.cache.incr('b', 5), 7)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.set_many({'c': 3, 'd': 4})
+        self.assertEqual(
+            self.cache.get_many(['a', 'c', 'd', 'e']),
+            {'a': {'x': 1}, 'c': 3, 'd': 4}
+        )
+        self.cache.delete('c')
+        self.assertFalse(self.cache.has_key('c'))
+        self.cache.set('gone', 1, timeout=0)
+        self.assertIsNone(self.cache.get('gone'))
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_shared_between_instances(self):
+        """Процессы с одним файлом видят общие записи."""
+        self.cache.set('shared', 'value')
+        self.assertEqual(self.make_cache().get('shared'), 'value')
+
+    def test_lru_eviction(self):
+        """При переполнении вытесняются давно не читанные записи."""
+        cache = self.make_cache(MAX_SIZE=4000, TOUCH_INTERVAL=0)
+        cache.set('old', 'x' * 1000)
+        cache.set('hot', 'x' * 1000)
+        time.sleep(0.01)
+        cache.get('hot')
+        cache.set('new', 'x' * 2500)
+        self.assertIsNone(cache.get('old'))
+        self.assertIsNotNone(cache.get('hot'))
+        self.assertIsNotNone(cache.get('new'))
+
+
+class MetricsTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        path = os.path.join(self.directory, 'metrics.sqlite3')
+        settings = override_settings(METRICS_PATH=path,
+                                     METRICS_FLUSH_INTERVAL=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        store.clear()
+
+    def test_view_metrics(self):
+        """Замеры копятся по имени представления."""
+        cache.clear()
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'))
+        self.client.get('/nonexist-page/')
+        feed = self.client.get(reverse('posts:index_feed', args=['rss']))
+        size = len(b''.join(feed.streaming_content))
+        staff = User.objects.create_user(username='admin', is_staff=True)
+        self.client.force_login(staff)
+        text = self.client.get(reverse('metrics')).content.decode()
+        label = 'view="posts:index"'
+        self.assertIn(
+            f'yatube_request_duration_seconds_count{{{label}}} 2', text)
+        self.assertIn(
+            f'yatube_request_duration_seconds_bucket{{{label},le="+Inf"}} 2',
+            text)
+        self.assertIn(f'yatube_db_queries_count{{{label}}} 2', text)
+        self.assertIn(f'yatube_cache_misses_total{{{label}}}', text)
+        self.assertIn(f'yatube_cache_hits_total{{{label}}}', text)
+        self.assertIn('view="<unresolved>"', text)
+        self.assertIn(
+            f'yatube_response_size_bytes_sum{{view="posts:index_feed"}} '
+            f'{float(size)}', text)
+
+    def test_shared_between_processes(self):
+        """Другой процесс (свой Store) видит сброшенные замеры."""
+        other = Store()
+        other.observe('yatube_db_queries', 'posts:profile', 3)
+        other.flush(force=True)
+        self.assertIn(
+            'yatube_db_queries_bucket{view="posts:profile",le="5"} 1',
+            store.render())
+
+    def test_metrics_are_private(self):
+        """По умолчанию /metrics закрыта даже для локального прокси."""
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, 403)
+        staff = User.objects.create_user(username='admin', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.5'])
+    def test_metrics_allowed_ips(self):
+        url = reverse('metrics')
+        self.assertEqual(
+            self.client.get(url, REMOTE_ADDR='10.0.0.5').status_code, 200)
+        self.assertEqual(
+            self.client.get(url, REMOTE_ADDR='127.0.0.1').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        url = reverse('metrics')
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 403)
+
+
+class ServerTimingTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_disabled_by_default(self):
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(SERVER_TIMING=True)
+    def test_header(self):
+        """Заголовок разбивает время ответа по этапам."""
+        header = self.client.get(reverse('posts:index'))['Server-Timing']
+        for name in ('db', 'template', 'thumbnail', 'cache', 'total'):
+            self.assertIn(f'{name};dur=', header)
+
+    @override_settings(SERVER_TIMING=True, SERVER_TIMING_FOOTER=True)
+    def test_footer_for_staff(self):
+        user = User.objects.create_user(username='user')
+        self.client.force_login(user)
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotContains(response, '<caption>Server-Timing')
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, '<caption>Server-Timing')
+
+
+class ProfilingTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        settings = override_settings(PROFILING_DIR=self.directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.url = reverse('posts:index')
+
+    def test_staff_only(self):
+        """?profile работает только для сотрудников."""
+        self.client.get(self.url, {'profile': ''})
+        self.assertFalse(RequestProfile.objects.exists())
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        self.client.get(self.url, {'profile': ''})
+        profile = RequestProfile.objects.get()
+        self.assertEqual(profile.view, 'posts:index')
+        self.assertEqual(profile.trigger, RequestProfile.STAFF)
+        self.assertEqual(profile.user, staff)
+        self.assertIn('cumulative', profiling.summary(profile.file))
+
+    def test_signed_header(self):
+        self.client.get(self.url, HTTP_X_PROFILE='forged')
+        self.assertFalse(RequestProfile.objects.exists())
+        self.client.get(self.url, HTTP_X_PROFILE=profiling.make_token())
+        self.assertEqual(RequestProfile.objects.get().trigger,
+                         RequestProfile.HEADER)
+
+    @override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_KEEP=2)
+    def test_sampling_and_rotation(self):
+        """Хранятся только последние PROFILING_KEEP профилей."""
+        for _ in range(3):
+            self.client.get(self.url)
+        names = set(RequestProfile.objects.values_list('file', flat=True))
+        self.assertEqual(len(names), 2)
+        self.assertEqual(set(os.listdir(self.directory)), names)
+
+    def test_admin_summary(self):
+        admin = User.objects.create_superuser(
+            username='root', email='root@example.com', password='pass')
+        self.client.force_login(admin)
+        self.client.get(self.url, {'profile': ''})
+        profile = RequestProfile.objects.get()
+        response = self.client.get(reverse(
+            'admin:core_requestprofile_change', args=[profile.pk]))
+        self.assertContains(response, 'cumulative')
+        response = self.client.get(reverse(
+            'admin:core_requestprofile_download', args=[profile.pk]))
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        self.client.post(reverse(
+            'admin:core_requestprofile_delete', args=[profile.pk]),
+            {'post': 'yes'})
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class SlowQueryLogTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        path = os.path.join(self.directory, 'slow.sqlite3')
+        settings = override_settings(SLOW_QUERY_PATH=path,
+                                     SLOW_QUERY_THRESHOLD=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            slowlog.fingerprint(
+                "SELECT * FROM t WHERE a = 'x''y' AND b IN (%s, %s, %s)\n"
+                "  LIMIT 21"),
+            'SELECT * FROM t WHERE a = ? AND b IN (...) LIMIT ?'
+        )
+
+    def test_view_queries_logged_with_plan(self):
+        author = User.objects.create_user(username='author')
+        with self.assertLogs('core.slowlog', 'WARNING') as logs:
+            self.client.get(reverse('posts:profile', args=[author.username]))
+        self.assertIn('posts:profile', logs.output[0])
+        rows = slowlog.log.top(limit=100)
+        self.assertTrue(rows)
+        self.assertEqual({row[0] for row in rows}, {'posts:profile'})
+        self.assertTrue(any(row[-1] for row in rows))
+
+    def test_repeated_queries_aggregated(self):
+        """N+1 складывается в одну строку с числом вызовов."""
+        author = User.objects.create_user(username='author')
+        posts = Post.objects.bulk_create(
+            Post(author=author, text=str(i)) for i in range(5))
+        trace = slowlog.Trace()
+        token = slowlog.current.set(trace)
+        try:
+            for post in Post.objects.all():
+                User.objects.get(pk=post.author_id)
+        finally:
+            slowlog.current.reset(token)
+        with self.assertLogs('core.slowlog', 'WARNING'):
+            slowlog.log.record('test', trace)
+        calls = {row[1]: row[2] for row in slowlog.log.top(order='calls')}
+        self.assertEqual(max(calls.values()), len(posts))
+        self.assertEqual(len(calls), 2)
+
+
+class QueryBudgetTest(TestCase):
+
+    def test_decorator(self):
+        @QueryBudget(1)
+        def lookup(count):
+            for _ in range(count):
+                User.objects.filter(username='nobody').exists()
+
+        lookup(1)
+        with self.assertRaisesMessage(QueryBudgetExceeded,
+                                      'Блок: 2 запросов при бюджете 1'):
+            lookup(2)
+
+
+class DatabaseProfileTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.path = os.path.join(self.directory, 'db.sqlite3')
+
+    def make_wrapper(self, **options):
+        wrapper = DatabaseWrapper({
+            **connection.settings_dict, 'NAME': self.path,
+            'OPTIONS': options,
+        }, alias='tuned')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas(self):
+        wrapper = self.make_wrapper(pragmas={'busy_timeout': 100})
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        # 1 - NORMAL
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 100)
+        self.assertEqual(self.pragma(wrapper, 'cache_size'), -64 * 1024)
+
+    def test_begin_immediate_with_retries(self):
+        """Транзакция сразу берёт блокировку записи, занятую - ждёт."""
+        wrapper = self.make_wrapper(pragmas={'busy_timeout': 10},
+                                    begin_retries=2)
+        wrapper.ensure_connection()
+        wrapper.immediate = True
+        other = sqlite3.connect(self.path, timeout=0, isolation_level=None)
+        self.addCleanup(other.close)
+        other.execute('BEGIN IMMEDIATE')
+        with mock.patch('core.db.base.time.sleep') as sleep:
+            with self.assertRaisesMessage(OperationalError, 'locked'):
+                wrapper._start_transaction_under_autocommit()
+        self.assertEqual(sleep.call_count, 2)
+        other.execute('ROLLBACK')
+        wrapper._start_transaction_under_autocommit()
+        with self.assertRaisesMessage(sqlite3.OperationalError, 'locked'):
+            other.execute('BEGIN IMMEDIATE')
+        wrapper.connection.execute('ROLLBACK')
+
+    def test_plain_atomic_is_deferred(self):
+        """Обычный atomic не берёт блокировку записи до первой записи."""
+        wrapper = self.make_wrapper()
+        wrapper.ensure_connection()
+        other = sqlite3.connect(self.path, timeout=0, isolation_level=None)
+        self.addCleanup(other.close)
+        wrapper._start_transaction_under_autocommit()
+        other.execute('BEGIN IMMEDIATE')
+        other.execute('ROLLBACK')
+        wrapper.connection.execute('ROLLBACK')
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command('sqlite_benchmark', '--readers', '1', '--writers', '1',
+                     '--seconds', '0.2', '--posts', '50', stdout=out)
+        self.assertIn('default', out.getvalue())
+        self.assertIn('tuned', out.getvalue())
+
+
+class WriteAtomicTest(TransactionTestCase):
+
+    def begins(self, block):
+        with CaptureQueriesContext(connection) as queries:
+            with block():
+                User.objects.exists()
+        return [query['sql'] for query in queries
+                if query['sql'].startswith('BEGIN')]
+
+    def test_only_write_blocks_are_immediate(self):
+        self.assertEqual(self.begins(write_atomic), ['BEGIN IMMEDIATE'])
+        self.assertEqual(self.begins(transaction.atomic), ['BEGIN'])
+        self.assertFalse(connection.immediate)
+
+
+class ReplicaRoutingTest(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.post = Post.objects.create(author=self.author, text='Пост')
+        self.author_client = self.client_class()
+        self.author_client.force_login(self.author)
+
+    def mark_synced(self):
+        # Тестовая реплика - зеркало default, копировать нечего
+        cache.set(replicas.SYNCED_KEY.format('replica'),
+                  (replicas.generation(), time.time()), None)
+
+    def replica_queries(self, client, url):
+        cache.clear()
+        self.mark_synced()
+        with CaptureQueriesContext(connections['replica']) as queries:
+            self.assertEqual(client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_stale_replica_is_not_used(self):
+        with CaptureQueriesContext(connections['replica']) as queries:
+            self.client.get(reverse('posts:index'))
+        self.assertEqual(len(queries), 0)
+
+    def test_feeds_read_from_replica(self):
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:profile', args=[self.author.username]),
+            reverse('posts:post_detail', args=[self.post.pk]),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertGreater(self.replica_queries(self.client, url), 0)
+
+    def test_writer_is_pinned_to_primary(self):
+        """После записи автор читает свой комментарий из default."""
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        self.mark_synced()
+        response = self.author_client.post(
+            reverse('posts:add_comment', args=[self.post.pk]),
+            {'text': 'Свежий комментарий'})
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+        self.assertEqual(Comment.objects.using('default').count(), 1)
+        with override_settings(REPLICA_MAX_LAG=0):
+            self.assertEqual(replicas.usable_replicas(), [])
+        self.assertEqual(self.replica_queries(self.author_client, url), 0)
+        self.assertGreater(self.replica_queries(self.client, url), 0)
+
+    def test_write_during_replica_read_is_not_cached(self):
+        """Запись между проверкой свежести реплики и чтением версий:
+        страница с реплики не кэшируется и уходит без ETag."""
+        url = reverse('posts:index')
+        cache.clear()
+        self.mark_synced()
+        response = self.client.get(url)
+        self.assertTrue(response.has_header('ETag'))
+        with CaptureQueriesContext(connections['replica']) as queries:
+            self.client.get(url)
+        self.assertEqual(len(queries), 0)
+
+        get_versions = caching.get_versions
+        writes = []
+
+        def write_then_read(items):
+            if not writes:
+                # Пишет другой процесс, не читающий запрос
+                token = replicas.current.set(None)
+                with transaction.atomic():
+                    writes.append(Post.objects.create(
+                        author=self.author, text='Новый пост'))
+                replicas.current.reset(token)
+            return get_versions(items)
+
+        cache.clear()
+        self.mark_synced()
+        with mock.patch('posts.caching.get_versions', write_then_read):
+            response = self.client_class().get(url)
+        self.assertFalse(response.has_header('ETag'))
+        post = caching.attach_card_versions(writes)[0]
+        self.assertIsNone(cache.get(make_template_fragment_key(
+            'post_card', [post.pk, post.card_version])))
+        self.mark_synced()
+        with CaptureQueriesContext(connections['replica']) as queries:
+            self.client_class().get(url)
+        self.assertGreater(len(queries), 0)
+
+    def test_generation_advances_after_write(self):
+        """Вне запроса счётчик сдвигается после записи, в atomic -
+        после коммита."""
+        start = replicas.generation()
+        seen = []
+
+        def check(execute, sql, params, many, context):
+            if sql.startswith('INSERT INTO "posts_post"'):
+                seen.append(replicas.generation())
+            return execute(sql, params, many, context)
+        with connection.execute_wrapper(check):
+            Post.objects.create(author=self.author, text='Без транзакции')
+            after_autocommit = replicas.generation()
+            with transaction.atomic():
+                Post.objects.create(author=self.author, text='В транзакции')
+                self.assertEqual(replicas.generation(), after_autocommit)
+        self.assertEqual(seen, [start, after_autocommit])
+        self.assertGreater(after_autocommit, start)
+        self.assertGreater(replicas.generation(), after_autocommit)
+
+    def test_reads_do_not_count_as_writes(self):
+        """Найденная get_or_create запись и профилированный GET
+        не сдвигают счётчик и не закрепляют браузер."""
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        staff_client = self.client_class()
+        staff_client.force_login(staff)
+        start = replicas.generation()
+        User.objects.get_or_create(username='author')
+        response = staff_client.get(reverse('posts:index'), {'profile': ''})
+        self.assertEqual(RequestProfile.objects.count(), 1)
+        self.assertNotIn(replicas.PIN_COOKIE, response.cookies)
+        self.assertEqual(replicas.generation(), start)
+
+    def test_unpinned_reads_use_lagging_replica(self):
+        """Пока другой браузер пишет, остальные читают реплику,
+        но не кэшируют страницы с неё."""
+        url = reverse('posts:index')
+        cache.clear()
+        self.mark_synced()
+        response = self.author_client.post(
+            reverse('posts:add_comment', args=[self.post.pk]),
+            {'text': 'Свежий комментарий'})
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+        with CaptureQueriesContext(connections['replica']) as queries:
+            response = self.client.get(url)
+        self.assertGreater(len(queries), 0)
+        self.assertFalse(response.has_header('ETag'))
+        with CaptureQueriesContext(connections['replica']) as queries:
+            self.author_client.get(url)
+            with override_settings(REPLICA_MAX_LAG=0):
+                self.client.get(url)
+        self.assertEqual(len(queries), 0)
+
+    def test_sync(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        source = os.path.join(directory, 'source.sqlite3')
+        target = os.path.join(directory, 'target.sqlite3')
+        with sqlite3.connect(source) as db:
+            db.execute('CREATE TABLE t (x)')
+            db.execute('INSERT INTO t VALUES (1)')
+        replicas.copy(source, target)
+        with sqlite3.connect(target) as db:
+            self.assertEqual(db.execute('SELECT x FROM t').fetchall(), [(1,)])
+        with mock.patch('core.replicas.copy') as copy:
+            call_command('sync_replica', stdout=StringIO())
+        copy.assert_called_once()
+        self.assertEqual(
+            [alias for alias, _ in replicas.usable_replicas()], ['replica'])
@@ -0,0 +1,140 @@
+"""Разбивка времени ответа по этапам для заголовка Server-Timing.
+
+Этапы: SQL-запросы (db), рендеринг шаблонов (template), миниатюры
+sorl (thumbnail) и обращения к кэшу (cache). Код размечает этапы
+через phase(); вне замеряемого запроса phase ничего не делает.
+
+Включается настройкой SERVER_TIMING. При SERVER_TIMING_FOOTER
+сотрудники (is_staff) видят те же цифры в подвале страницы: base.html
+оставляет место FOOTER_SLOT, которое заполняется после рендеринга.
+"""
+import contextvars
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates
+from django.template.backends.django import Template as DjangoTemplate
+from django.template.backends.django import reraise
+from django.template.loader import render_to_string
+
+FOOTER_SLOT = '<!-- server-timing -->'
+FOOTER_TEMPLATE = 'includes/server_timing.html'
+
+# Имя в заголовке и описание этапа (заголовки HTTP - только latin-1)
+PHASES = {
+    'db': 'Database',
+    'template': 'Templates',
+    'thumbnail': 'Thumbnails',
+    'cache': 'Cache',
+}
+
+current = contextvars.ContextVar('server_timing', default=None)
+
+
+class Timings:
+    """Суммарное время и число вызовов каждого этапа одного запроса."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {name: [0.0, 0] for name in PHASES}
+
+    def add(self, name, seconds):
+        phase = self.phases[name]
+        phase[0] += seconds
+        phase[1] += 1
+
+    def __call__(self, execute, sql, params, many, context):
+        # Обёртка connection.execute_wrapper
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add('db', time.perf_counter() - started)
+
+    def rows(self):
+        """(имя, описание, мс, вызовов) для этапов и total."""
+        rows = [
+            (name, PHASES[name], seconds * 1000, count)
+            for name, (seconds, count) in self.phases.items()
+        ]
+        total = (time.perf_counter() - self.started) * 1000
+        return rows + [('total', 'Total', total, 1)]
+
+    def header(self):
+        return ', '.join(
+            f'{name};dur={ms:.1f};desc="{description} ({count})"'
+            for name, description, ms, count in self.rows()
+        )
+
+
+@contextmanager
+def phase(name):
+    """Засчитывает время блока (или вызова функции) этапу name."""
+    timings = current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+class Template(DjangoTemplate):
+    def render(self, context=None, request=None):
+        with phase('template'):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Бэкенд шаблонов Django, замеряющий рендеринг для Server-Timing.
+
+    Замеряется только шаблон верхнего уровня, include входят в него.
+    """
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class ServerTimingMiddleware:
+    """Добавляет заголовок Server-Timing и подвал с замерами для staff.
+
+    Ставится после AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'SERVER_TIMING', False):
+            return self.get_response(request)
+        timings = Timings()
+        token = current.set(timings)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings))
+                response = self.get_response(request)
+        finally:
+            current.reset(token)
+        show_footer = (getattr(settings, 'SERVER_TIMING_FOOTER', False)
+                       and request.user.is_staff
+                       and not response.streaming
+                       and FOOTER_SLOT.encode() in response.content)
+        if show_footer:
+            footer = render_to_string(FOOTER_TEMPLATE,
+                                      {'timings': timings.rows()})
+            response.content = response.content.replace(
+                FOOTER_SLOT.encode(), footer.encode(), 1)
+        response['Server-Timing'] = timings.header()
+        return response
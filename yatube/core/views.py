@@ -1,4 +1,10 @@
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+
+from core.metrics import store
 
 
 def page_not_found(request, exception):
@@ -15,3 +21,23 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+def metrics_allowed(request):
+    """Сотрудник, адрес из METRICS_ALLOWED_IPS или токен METRICS_TOKEN."""
+    if request.user.is_staff:
+        return True
+    allowed_ips = getattr(settings, 'METRICS_ALLOWED_IPS', [])
+    if request.META.get('REMOTE_ADDR') in allowed_ips:
+        return True
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    return bool(token) and constant_time_compare(
+        request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}')
+
+
+def metrics(request):
+    if not metrics_allowed(request):
+        raise PermissionDenied
+    return HttpResponse(
+        store.render(), content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -0,0 +1,134 @@
+"""Замер всех страниц posts/urls.py через тестовый клиент Django.
+
+Для каждого адреса собираются перцентили времени ответа, число
+SQL-запросов и размер ответа. Результаты можно сохранить как базовые
+и сравнивать с ними следующие прогоны.
+
+Адреса, которые меняют данные по GET (подписка и отписка), не замеряются:
+откат транзакции не вернул бы версии общего кэша, поднятые при записи,
+а одна транзакция на весь обход держала бы блокировку записи SQLite.
+Каждый запрос выполняется в своей транзакции, как на сайте.
+"""
+import json
+import time
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import urls
+from .models import Group, Post, UserStats
+
+PERCENTILES = (50, 90, 99)
+# Допустимый рост медианы времени относительно базового прогона
+TOLERANCE: float = 0.2
+# Страницы, которые по GET пишут в базу
+MUTATING = frozenset({'profile_follow', 'profile_unfollow'})
+
+
+def percentile(values, rank):
+    ordered = sorted(values)
+    index = max(0, -(-len(ordered) * rank // 100) - 1)
+    return ordered[index]
+
+
+def sample_kwargs(query):
+    """Значения параметров адресов: самые нагруженные группа, автор, пост."""
+    author = UserStats.objects.select_related('user').order_by(
+        '-followers_count').first()
+    group = Group.objects.order_by('pk').first()
+    post = Post.objects.order_by('-comments_count', '-pk').first()
+    return {
+        'slug': group.slug if group else None,
+        'username': author.user.username if author else None,
+        'post_id': post.pk if post else None,
+        'fmt': 'rss',
+    }, {'search': f'?q={query}'}
+
+
+def targets(query='кошка'):
+    """Пары (имя, адрес) для всех шаблонов posts/urls.py."""
+    values, suffixes = sample_kwargs(query)
+    found = []
+    for pattern in urls.urlpatterns:
+        names = pattern.pattern.converters
+        kwargs = {name: values[name] for name in names}
+        if None in kwargs.values():
+            continue
+        url = reverse(f'{urls.app_name}:{pattern.name}', kwargs=kwargs)
+        found.append((pattern.name, url + suffixes.get(pattern.name, '')))
+    return found
+
+
+def viewer():
+    """Пользователь с самой длинной лентой подписок."""
+    stats = UserStats.objects.select_related('user').order_by(
+        '-following_count').first()
+    return stats.user if stats else None
+
+
+def measure(client, url, repeat, cold=False):
+    timings = []
+    for _ in range(repeat):
+        if cold:
+            cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = client.get(url)
+            if response.streaming:
+                size = sum(len(part) for part in response.streaming_content)
+            else:
+                size = len(response.content)
+            timings.append((time.perf_counter() - started) * 1000)
+    result = {
+        'url': url,
+        'status': response.status_code,
+        'queries': len(queries),
+        'bytes': size,
+    }
+    for rank in PERCENTILES:
+        result[f'p{rank}'] = percentile(timings, rank)
+    return result
+
+
+def run(repeat=20, cold=False, anonymous=False, query='кошка', extra=()):
+    """Замеряет все страницы, кроме MUTATING, возвращает {имя: результат}."""
+    client = Client()
+    results = {}
+    user = None if anonymous else viewer()
+    if user is not None:
+        client.force_login(user)
+    for name, url in [*targets(query), *((url, url) for url in extra)]:
+        if name not in MUTATING:
+            results[name] = measure(client, url, repeat, cold)
+    return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Регрессии относительно базового прогона: список строк."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result['queries'] > before['queries']:
+            regressions.append(
+                f'{name}: запросов {before["queries"]} -> '
+                f'{result["queries"]}')
+        if result['p50'] > before['p50'] * (1 + tolerance):
+            regressions.append(
+                f'{name}: медиана {before["p50"]:.1f} -> '
+                f'{result["p50"]:.1f} мс')
+    return regressions
+
+
+def load(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save(results, path):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
@@ -0,0 +1,49 @@
+"""Бюджеты SQL-запросов страниц posts/urls.py.
+
+Число запросов страницы не зависит от числа постов на ней (вплоть до
+POSTS_ON_PAGE): авторы и группы приходят вместе с постами, миниатюры
+картинок - одним пакетным запросом. Бюджет - число запросов GET
+для авторизованного пользователя при холодном кэше, включая два
+запроса сессии и пользователя; гостю и тёплому кэшу нужно меньше.
+Ленты RSS/Atom/JSON читают до FEED_ITEMS постов порциями, поэтому
+их бюджет рассчитан на все порции.
+"""
+from urllib.parse import urlsplit
+
+from django.urls import resolve
+
+from core.querybudget import QueryBudget
+
+from . import feeds, urls
+
+FEED_CHUNKS = -(-feeds.FEED_ITEMS // feeds.CHUNK_SIZE)
+
+QUERY_BUDGETS = {
+    'index': 5,
+    'index_feed': 2 + FEED_CHUNKS,
+    'group_list': 6,
+    'group_feed': 3 + FEED_CHUNKS,
+    'profile': 8,
+    'profile_feed': 4 + FEED_CHUNKS,
+    'search': 4,
+    'post_detail': 5,
+    'post_create': 5,
+    'post_edit': 5,
+    'add_comment': 5,
+    'post_comments': 2,
+    'follow_index': 6,
+    'profile_follow': 7,
+    # отписка снимает посты автора с ленты подписчика
+    'profile_unfollow': 10,
+}
+
+
+def budget_for(name):
+    """QueryBudget страницы по имени адреса: 'index' или 'posts:index'."""
+    name = name.split(':')[-1]
+    return QueryBudget(QUERY_BUDGETS[name], label=f'{urls.app_name}:{name}')
+
+
+def budget_for_url(url):
+    """QueryBudget страницы по адресу, например '/group/cats/?page=2'."""
+    return budget_for(resolve(urlsplit(url).path).url_name)
@@ -0,0 +1,488 @@
+"""Массовая загрузка и выгрузка пользователей, групп, постов,
+комментариев и подписок.
+
+Записи читаются потоком из JSONL или CSV (в том числе .gz), авторы
+и группы находятся по словарям username -> id и slug -> id, а строки
+вставляются пачками (bulk_insert). Пакетная вставка не отправляет
+сигналы post_save, поэтому счётчики, ленты подписок и поисковый индекс после
+загрузки пересчитываются целиком (rebuild_derived).
+
+Выгрузка читает таблицы порциями по возрастанию id (без OFFSET
+и без загрузки всей таблицы) в том же формате, что понимает загрузка.
+"""
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.models import AutoField, Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core import replicas
+from core.db import write_atomic
+
+from . import caching, counters, search, timeline
+from .models import Comment, Follow, Group, Post, User
+
+JSONL = 'jsonl'
+CSV = 'csv'
+FORMATS = (JSONL, CSV)
+
+BATCH_SIZE: int = 1000
+TRANSACTION_SIZE: int = 20000
+EXPORT_CHUNK_SIZE: int = 5000
+
+
+class RowError(ValueError):
+    """Строку входных данных нельзя превратить в запись."""
+
+
+def detect_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    return CSV if name.endswith('.csv') else JSONL
+
+
+@contextmanager
+def standard_stream(buffer):
+    """Текст поверх sys.stdin/stdout.buffer, который их не закрывает."""
+    stream = io.TextIOWrapper(buffer, encoding='utf-8', newline='')
+    try:
+        yield stream
+    finally:
+        stream.detach()
+
+
+def open_input(path):
+    if path == '-':
+        return standard_stream(sys.stdin.buffer)
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def read_rows(stream, fmt):
+    """Пары (номер строки файла, словарь записи), по одной за раз.
+
+    Неверный JSON и строка JSONL, которая не объект, - RowError
+    с номером строки.
+    """
+    if fmt == CSV:
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            raise RowError(f'Строка {number}: неверный JSON ({error})')
+        if not isinstance(row, dict):
+            raise RowError(f'Строка {number}: ожидается объект JSON')
+        yield number, row
+
+
+class Lookups:
+    """id пользователей и групп по username и slug, загружаются один раз."""
+
+    def __init__(self):
+        self._users = None
+        self._groups = None
+
+    def user(self, username):
+        if self._users is None:
+            self._users = dict(User.objects.values_list('username', 'pk'))
+        try:
+            return self._users[username]
+        except KeyError:
+            raise RowError(f'Нет пользователя {username!r}')
+
+    def group(self, slug):
+        if not slug:
+            return None
+        if self._groups is None:
+            self._groups = dict(Group.objects.values_list('slug', 'pk'))
+        try:
+            return self._groups[slug]
+        except KeyError:
+            raise RowError(f'Нет группы {slug!r}')
+
+
+def _created(row):
+    value = row.get('created')
+    if not value:
+        return timezone.now()
+    created = parse_datetime(value)
+    if created is None:
+        raise RowError(f'Неверная дата {value!r}')
+    if timezone.is_naive(created):
+        created = timezone.make_aware(created)
+    return created
+
+
+def _pk(row):
+    return int(row['id']) if row.get('id') else None
+
+
+def _required(row, key):
+    value = row[key]
+    if value is None or value == '':
+        raise RowError(f'Пустое поле {key!r}')
+    return value
+
+
+def build_user(row, lookups):
+    user = User(
+        username=_required(row, 'username'),
+        first_name=row.get('first_name', ''),
+        last_name=row.get('last_name', ''),
+        email=row.get('email', ''),
+    )
+    if row.get('password'):
+        # Ожидается уже захэшированный пароль, как в выгрузке
+        # с --include-passwords
+        user.password = row['password']
+    else:
+        user.set_unusable_password()
+    return user
+
+
+def build_group(row, lookups):
+    return Group(
+        pk=_pk(row),
+        title=_required(row, 'title'),
+        slug=_required(row, 'slug'),
+        description=row.get('description', ''),
+    )
+
+
+def build_post(row, lookups):
+    return Post(
+        pk=_pk(row),
+        author_id=lookups.user(_required(row, 'author')),
+        group_id=lookups.group(row.get('group')),
+        text=_required(row, 'text'),
+        image=row.get('image') or '',
+        created=_created(row),
+    )
+
+
+def build_comment(row, lookups):
+    return Comment(
+        pk=_pk(row),
+        post_id=int(_required(row, 'post')),
+        author_id=lookups.user(_required(row, 'author')),
+        text=_required(row, 'text'),
+        created=_created(row),
+    )
+
+
+def build_follow(row, lookups):
+    return Follow(
+        user_id=lookups.user(_required(row, 'user')),
+        author_id=lookups.user(_required(row, 'author')),
+    )
+
+
+KINDS = {
+    'users': (User, build_user),
+    'groups': (Group, build_group),
+    'posts': (Post, build_post),
+    'comments': (Comment, build_comment),
+    'follows': (Follow, build_follow),
+}
+
+
+def bulk_insert(model, objects, batch_size, ignore_conflicts=False):
+    """bulk_create, который сохраняет created из объектов.
+
+    bulk_create вызывает pre_save полей, и auto_now_add подменяет дату
+    из файла текущим временем. Вставка с raw=True, как при загрузке
+    фикстур, пишет значения атрибутов как есть.
+    """
+    fields = model._meta.concrete_fields
+    for field in fields:
+        if getattr(field, 'auto_now_add', False):
+            now = timezone.now()
+            for obj in objects:
+                if getattr(obj, field.attname) is None:
+                    setattr(obj, field.attname, now)
+    queryset = model._base_manager.all()
+    # Как в bulk_create: база выбирается через db_for_write
+    queryset._for_write = True
+    with_pk = [obj for obj in objects if obj.pk is not None]
+    without_pk = [obj for obj in objects if obj.pk is None]
+    for objs, columns in (
+        (with_pk, fields),
+        (without_pk, [f for f in fields if not isinstance(f, AutoField)]),
+    ):
+        for start in range(0, len(objs), batch_size):
+            queryset._insert(objs[start:start + batch_size], fields=columns,
+                             raw=True, ignore_conflicts=ignore_conflicts)
+
+
+class Progress:
+    """Счётчик загруженных строк и скорость загрузки."""
+
+    def __init__(self):
+        self.rows = 0
+        self.started = time.monotonic()
+
+    @property
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.rows / elapsed if elapsed else 0.0
+
+
+def insert_objects(model, objects, batch_size=BATCH_SIZE,
+                   transaction_size=TRANSACTION_SIZE, ignore_conflicts=False,
+                   on_commit=None):
+    """Вставляет объекты model из итератора objects, возвращает Progress.
+
+    Каждые transaction_size объектов фиксируются отдельной транзакцией,
+    внутри неё bulk_insert пишет пачками по batch_size. on_commit
+    вызывается с Progress после каждой транзакции.
+    """
+    progress = Progress()
+    explicit_pks = False
+    chunk = []
+
+    # Django 2.2 не ограничивает явный batch_size лимитами СУБД
+    fields = model._meta.concrete_fields
+
+    def flush():
+        limit = connection.ops.bulk_batch_size(fields, chunk)
+        with write_atomic():
+            bulk_insert(model, chunk, min(batch_size, limit),
+                        ignore_conflicts=ignore_conflicts)
+        progress.rows += len(chunk)
+        chunk.clear()
+        if on_commit:
+            on_commit(progress)
+
+    try:
+        for obj in objects:
+            explicit_pks = explicit_pks or obj.pk is not None
+            chunk.append(obj)
+            if len(chunk) >= transaction_size:
+                flush()
+        if chunk:
+            flush()
+    finally:
+        # Уже зафиксированные транзакции остаются и при ошибке
+        if explicit_pks and progress.rows:
+            _reset_sequences(model)
+    return progress
+
+
+def import_rows(kind, rows, ignore_conflicts=False, **options):
+    """Загружает записи kind из пар (номер строки, словарь), как у read_rows.
+
+    Параметры пачек и транзакций - как у insert_objects. При ошибке
+    в строке поднимается RowError с её номером.
+    """
+    model, build = KINDS[kind]
+    lookups = Lookups()
+
+    def objects():
+        for number, row in rows:
+            try:
+                yield build(row, lookups)
+            except KeyError as error:
+                raise RowError(f'Строка {number}: нет поля {error}')
+            except ValueError as error:
+                raise RowError(f'Строка {number}: {error}') from error
+
+    # Повторная подписка - не ошибка загрузки
+    return insert_objects(
+        model, objects(),
+        ignore_conflicts=ignore_conflicts or model is Follow, **options)
+
+
+def _reset_sequences(model):
+    # Следующие id после загруженных явно (в SQLite не требуется)
+    statements = connection.ops.sequence_reset_sql(no_style(), [model])
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def rebuild_derived():
+    """Пересчитывает всё, что обычно поддерживают сигналы моделей."""
+    counters.rebuild()
+    timeline.rebuild()
+    search.rebuild()
+    replicas.advance()
+    caching.bump(*caching.FEED)
+
+
+# Поля выгрузки: имя в файле -> путь в values(); поле для --since
+EXPORTS = {
+    'users': (User, {
+        'id': 'pk', 'username': 'username', 'first_name': 'first_name',
+        'last_name': 'last_name', 'email': 'email',
+    }, 'date_joined'),
+    'groups': (Group, {
+        'id': 'pk', 'title': 'title', 'slug': 'slug',
+        'description': 'description',
+    }, None),
+    'posts': (Post, {
+        'id': 'pk', 'author': 'author__username', 'group': 'group__slug',
+        'text': 'text', 'image': 'image', 'created': 'created',
+    }, 'created'),
+    'comments': (Comment, {
+        'id': 'pk', 'post': 'post_id', 'author': 'author__username',
+        'text': 'text', 'created': 'created',
+    }, 'created'),
+    'follows': (Follow, {
+        'id': 'pk', 'user': 'user__username', 'author': 'author__username',
+    }, None),
+}
+
+# Хэши паролей выгружаются только по явной просьбе (--include-passwords)
+PASSWORDS = {'password': 'password'}
+
+
+def export_fields(kind, passwords=False):
+    """Поля выгрузки kind; хэши паролей - только если passwords."""
+    fields = EXPORTS[kind][1]
+    if passwords and EXPORTS[kind][0] is User:
+        fields = {**fields, **PASSWORDS}
+    return fields
+
+
+def export_queryset(kind, since=None):
+    model, _, since_field = EXPORTS[kind]
+    queryset = model.objects.all()
+    if since is not None:
+        if since_field is None:
+            raise ValueError(f'У записей {kind} нет даты создания')
+        queryset = queryset.filter(**{f'{since_field}__gte': since})
+    return queryset
+
+
+def pk_ranges(queryset, parts):
+    """Делит диапазон id на parts полуоткрытых отрезков [start, stop)."""
+    bounds = queryset.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return []
+    low, high = bounds['low'], bounds['high'] + 1
+    step = -(-(high - low) // parts)
+    return [
+        (start, min(start + step, high)) for start in range(low, high, step)
+    ]
+
+
+def export_rows(kind, since=None, start=None, stop=None,
+                chunk_size=EXPORT_CHUNK_SIZE, passwords=False):
+    """Словари записей kind по возрастанию id, порциями по chunk_size."""
+    fields = export_fields(kind, passwords)
+    queryset = export_queryset(kind, since).order_by('pk')
+    if stop is not None:
+        queryset = queryset.filter(pk__lt=stop)
+    last = start - 1 if start is not None else None
+    names = list(fields)
+    while True:
+        chunk = queryset if last is None else queryset.filter(pk__gt=last)
+        rows = list(chunk.values_list(*fields.values())[:chunk_size])
+        for values in rows:
+            yield {
+                name: _exported(value) for name, value in zip(names, values)
+            }
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1][0]
+
+
+def _exported(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def open_output(path):
+    if path == '-':
+        return standard_stream(sys.stdout.buffer)
+    if path.endswith('.gz'):
+        return gzip.open(path, 'wt', encoding='utf-8', newline='',
+                         compresslevel=6)
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def write_rows(stream, fmt, kind, rows, passwords=False):
+    """Пишет записи в открытый файл, возвращает их число."""
+    count = 0
+    if fmt == CSV:
+        writer = csv.DictWriter(
+            stream, fieldnames=list(export_fields(kind, passwords)))
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+        return count
+    for row in rows:
+        stream.write(json.dumps(row, ensure_ascii=False))
+        stream.write('\n')
+        count += 1
+    return count
+
+
+def part_path(path, number):
+    """posts.jsonl.gz -> posts.1.jsonl.gz, my.posts.csv -> my.posts.1.csv"""
+    directory, name = os.path.split(path)
+    suffix = ''
+    if name.endswith('.gz'):
+        name, suffix = name[:-3], '.gz'
+    for fmt in FORMATS:
+        if name.endswith(f'.{fmt}'):
+            name, suffix = name[:-len(fmt) - 1], f'.{fmt}{suffix}'
+            break
+    return os.path.join(directory, f'{name}.{number}{suffix}')
+
+
+def export(kind, path, fmt, since=None, workers=1,
+           chunk_size=EXPORT_CHUNK_SIZE, passwords=False):
+    """Выгружает записи kind в path, возвращает Progress.
+
+    При workers > 1 диапазон id делится на части, и каждая пишется
+    в свой файл (part_path) в отдельном потоке со своим соединением.
+    Хэши паролей пользователей попадают в файл, только если passwords.
+    """
+    progress = Progress()
+    if workers <= 1:
+        with open_output(path) as stream:
+            progress.rows = write_rows(
+                stream, fmt, kind,
+                export_rows(kind, since, chunk_size=chunk_size,
+                            passwords=passwords),
+                passwords=passwords)
+        return progress
+
+    def dump(number, start, stop):
+        try:
+            with open_output(part_path(path, number)) as stream:
+                return write_rows(stream, fmt, kind, export_rows(
+                    kind, since, start, stop, chunk_size=chunk_size,
+                    passwords=passwords), passwords=passwords)
+        finally:
+            connection.close()
+
+    ranges = pk_ranges(export_queryset(kind, since), workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(dump, number, start, stop)
+            for number, (start, stop) in enumerate(ranges, start=1)
+        ]
+        progress.rows = sum(future.result() for future in futures)
+    return progress
@@ -0,0 +1,169 @@
+"""Версии закэшированных фрагментов.
+
+У поста, автора и группы есть счётчик версии в кэше. Сигналы моделей
+сдвигают его при изменении записи, а ключи кэша включают версии,
+поэтому устаревший фрагмент просто перестаёт запрашиваться - TTL не нужен.
+
+Те же версии служат ключами закэшированных страниц лент: запись поста
+сдвигает версию FEED, и страницы можно держать в кэше часами.
+Персональная шапка в закэшированную страницу подставляется
+при каждом ответе (по аналогии с edge-side includes).
+
+Из тех же версий и id зрителя собираются ETag страниц: повторный
+запрос с If-None-Match получает 304 без рендеринга шаблонов.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+
+from core import replicas
+
+from .models import User
+
+VERSION_KEY = 'version:{}:{}'
+FEED = ('page', 'feed')
+
+HEADER_SLOT = '<!-- header -->'
+HEADER_TEMPLATE = 'includes/header.html'
+
+
+def _fresh():
+    # После вытеснения счётчик не должен вернуться к старому значению
+    return int(time.time() * 1000)
+
+
+def _incr(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _fresh(), None)
+
+
+def bump(kind, pk):
+    """Сдвигает версию записи: связанные с ней фрагменты устаревают.
+
+    В транзакции версия сдвигается ещё раз после коммита: то, что
+    до коммита закэшировали по старым данным под промежуточной
+    версией, больше не запрашивается.
+    """
+    key = VERSION_KEY.format(kind, pk)
+    _incr(key)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _incr(key))
+
+
+def get_versions(items):
+    """Версии для пар (kind, pk) одним обращением к кэшу."""
+    keys = {item: VERSION_KEY.format(*item) for item in items}
+    found = cache.get_many(keys.values())
+    missing = {
+        key: _fresh() for key in keys.values() if key not in found
+    }
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return {item: found[key] for item, key in keys.items()}
+
+
+def _card_items(post):
+    return (('post', post.pk), ('user', post.author_id),
+            ('group', post.group_id))
+
+
+def attach_card_versions(posts):
+    """Проставляет post.card_version для кэша карточек постов.
+
+    Версия меняется вместе с постом, именем автора и группой.
+    Если версии могли обогнать данные реплики, карточки рендерятся
+    без кэша.
+    """
+    posts = list(posts)
+    versions = get_versions(
+        {item for post in posts for item in _card_items(post)}
+    )
+    if not replicas.consistent():
+        for post in posts:
+            post.card_version = None
+        return posts
+    for post in posts:
+        post.card_version = '.'.join(
+            str(versions[item]) for item in _card_items(post)
+        )
+    return posts
+
+
+def cache_feed_page(view):
+    """Кэширует общую часть страницы ленты, шапку подставляет на лету.
+
+    В кэш попадает HTML без шапки (base.html оставляет на её месте
+    HEADER_SLOT), а шапка с именем пользователя рендерится отдельно
+    для каждого запроса. Поэтому одна запись кэша обслуживает
+    и гостей, и авторизованных пользователей. Ключ меняется
+    с каждой записью в лентах.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+        version = get_versions([FEED])[FEED]
+        path = hashlib.md5(
+            request.build_absolute_uri().encode()
+        ).hexdigest()
+        key = f'feed_page:{version}:{path}'
+        body = cache.get(key)
+        if body is None:
+            request.stitch_header = True
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200 or response.streaming:
+                return stitch_header(request, response)
+            body = response.content.decode(response.charset)
+            if replicas.consistent():
+                cache.set(key, body, settings.FEED_CACHE_TIMEOUT)
+        else:
+            response = HttpResponse()
+        response.content = body.replace(
+            HEADER_SLOT, render_to_string(HEADER_TEMPLATE, request=request)
+        )
+        return response
+    return wrapper
+
+
+def stitch_header(request, response):
+    if not response.streaming:
+        response.content = response.content.replace(
+            HEADER_SLOT.encode(),
+            render_to_string(HEADER_TEMPLATE, request=request).encode(),
+        )
+    return response
+
+
+def _etag(request, *items):
+    versions = get_versions(items)
+    parts = [str(request.user.pk or 0)]
+    parts += [str(versions[item]) for item in items]
+    return hashlib.md5(':'.join(parts).encode()).hexdigest()
+
+
+def feed_etag(request, *args, **kwargs):
+    """ETag ленты и страницы поста.
+
+    FEED сдвигается при любом изменении постов, комментариев, групп
+    и пользователей, так что отдельные версии записей не нужны.
+    """
+    return _etag(request, FEED)
+
+
+def profile_etag(request, username, **kwargs):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True).first()
+    return _etag(request, FEED, ('follows', author_id))
+
+
+def follow_etag(request):
+    return _etag(request, FEED, ('follows', request.user.pk))
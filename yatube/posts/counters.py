@@ -0,0 +1,69 @@
+"""Денормализованные счётчики постов, комментариев и подписок.
+
+Счётчики меняются сигналами в той же транзакции, что и сами записи,
+rebuild() пересчитывает их с нуля (команда rebuild_counters).
+"""
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from core.db import write_atomic
+
+from .models import Comment, Follow, Post, UserStats
+
+User = get_user_model()
+
+
+def _change(queryset, field, delta):
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def change_user(user_id, field, delta):
+    """Сдвигает счётчик пользователя, при необходимости заводит строку."""
+    stats = UserStats.objects.filter(user_id=user_id)
+    if _change(stats, field, delta) or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            UserStats.objects.create(user_id=user_id, **{field: delta})
+    except IntegrityError:
+        _change(stats, field, delta)
+
+
+def change_post(post_id, delta):
+    _change(Post.objects.filter(pk=post_id), 'comments_count', delta)
+
+
+def stats_for(user):
+    """Счётчики пользователя; нули, если строки ещё нет."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return UserStats(user=user)
+
+
+def _count(model, field):
+    counts = model.objects.filter(**{field: OuterRef('pk')}).order_by(
+    ).values(field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counts), 0)
+
+
+@write_atomic
+def rebuild():
+    """Пересчитывает все счётчики по таблицам постов и подписок."""
+    Post.objects.update(comments_count=_count(Comment, 'post'))
+    UserStats.objects.all().delete()
+    users = User.objects.annotate(
+        posts_total=_count(Post, 'author'),
+        followers_total=_count(Follow, 'author'),
+        following_total=_count(Follow, 'user'),
+    ).values_list('pk', 'posts_total', 'followers_total', 'following_total')
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=pk, posts_count=posts, followers_count=followers,
+                   following_count=following)
+         for pk, posts, followers, following in users.iterator()),
+        batch_size=500,
+    )
@@ -0,0 +1,162 @@
+"""Машиночитаемые ленты постов: RSS 2.0, Atom и JSON Feed.
+
+Документ собирается генератором и отдаётся StreamingHttpResponse,
+посты читаются порциями по курсору, а не одним запросом.
+"""
+import json
+from xml.sax.saxutils import escape, quoteattr
+
+from django.http import Http404, StreamingHttpResponse
+from django.template.defaultfilters import truncatechars
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.feedgenerator import rfc2822_date, rfc3339_date
+
+from .utils import KeysetPaginator
+
+FEED_ITEMS: int = 50
+CHUNK_SIZE: int = 20
+
+CONTENT_TYPES = {
+    'rss': 'application/rss+xml; charset=utf-8',
+    'atom': 'application/atom+xml; charset=utf-8',
+    'json': 'application/feed+json; charset=utf-8',
+}
+
+
+def iter_posts(queryset, limit=FEED_ITEMS, chunk_size=CHUNK_SIZE):
+    """Первые limit постов порциями по chunk_size."""
+    paginator = KeysetPaginator(queryset, chunk_size)
+    page = paginator.page()
+    while True:
+        for post in page:
+            if limit <= 0:
+                return
+            limit -= 1
+            yield post
+        if not page.has_next():
+            return
+        page = paginator.page(after=page.next_cursor)
+
+
+class Entry:
+    """Поля поста, общие для всех форматов."""
+
+    def __init__(self, request, post):
+        self.id = request.build_absolute_uri(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        self.title = truncatechars(post.text, 50)
+        self.text = post.text
+        self.author = post.author.get_full_name() or post.author.username
+        self.created = post.created
+        self.group = post.group.title if post.group_id else None
+
+
+def _tag(name, value, **attrs):
+    attributes = ''.join(
+        f' {key}={quoteattr(str(item))}'
+        for key, item in attrs.items()
+    )
+    if value is None:
+        return f'<{name}{attributes}/>'
+    return f'<{name}{attributes}>{escape(str(value))}</{name}>'
+
+
+def rss(title, link, entries):
+    yield '<?xml version="1.0" encoding="utf-8"?>\n'
+    yield ('<rss version="2.0" '
+           'xmlns:dc="http://purl.org/dc/elements/1.1/"><channel>')
+    yield _tag('title', title) + _tag('link', link)
+    yield _tag('description', title) + _tag('language', 'ru')
+    for entry in entries:
+        yield ''.join([
+            '<item>',
+            _tag('title', entry.title),
+            _tag('link', entry.id),
+            _tag('guid', entry.id),
+            _tag('description', entry.text),
+            _tag('dc:creator', entry.author),
+            _tag('pubDate', rfc2822_date(entry.created)),
+            _tag('category', entry.group) if entry.group else '',
+            '</item>',
+        ])
+    yield '</channel></rss>\n'
+
+
+def atom(title, link, entries, updated):
+    yield '<?xml version="1.0" encoding="utf-8"?>\n'
+    yield '<feed xmlns="http://www.w3.org/2005/Atom" xml:lang="ru">'
+    yield _tag('title', title) + _tag('id', link)
+    yield _tag('link', None, href=link, rel='alternate')
+    yield _tag('updated', rfc3339_date(updated))
+    for entry in entries:
+        yield ''.join([
+            '<entry>',
+            _tag('title', entry.title),
+            _tag('link', None, href=entry.id, rel='alternate'),
+            _tag('id', entry.id),
+            _tag('updated', rfc3339_date(entry.created)),
+            _tag('published', rfc3339_date(entry.created)),
+            f'<author>{_tag("name", entry.author)}</author>',
+            _tag('summary', entry.text),
+            _tag('category', None, term=entry.group) if entry.group else '',
+            '</entry>',
+        ])
+    yield '</feed>\n'
+
+
+def json_feed(title, link, entries):
+    yield json.dumps({
+        'version': 'https://jsonfeed.org/version/1.1',
+        'title': title,
+        'home_page_url': link,
+        'language': 'ru',
+    }, ensure_ascii=False)[:-1] + ', "items": ['
+    separator = ''
+    for entry in entries:
+        item = {
+            'id': entry.id,
+            'url': entry.id,
+            'title': entry.title,
+            'content_text': entry.text,
+            'date_published': rfc3339_date(entry.created),
+            'authors': [{'name': entry.author}],
+        }
+        if entry.group:
+            item['tags'] = [entry.group]
+        yield separator + json.dumps(item, ensure_ascii=False)
+        separator = ', '
+    yield ']}\n'
+
+
+def _entries(request, first, posts):
+    if first is not None:
+        yield Entry(request, first)
+    for post in posts:
+        yield Entry(request, post)
+
+
+def stream(request, fmt, title, path, queryset):
+    """StreamingHttpResponse с лентой постов queryset в формате fmt.
+
+    path - адрес HTML-страницы, которую повторяет лента.
+    """
+    if fmt not in CONTENT_TYPES:
+        raise Http404(f'Неизвестный формат ленты: {fmt}')
+    link = request.build_absolute_uri(path)
+
+    def generate():
+        posts = iter_posts(queryset)
+        # Atom требует дату обновления ленты до первой записи
+        first = next(posts, None)
+        entries = _entries(request, first, posts)
+        if fmt == 'rss':
+            yield from rss(title, link, entries)
+        elif fmt == 'atom':
+            updated = first.created if first else timezone.now()
+            yield from atom(title, link, entries, updated)
+        else:
+            yield from json_feed(title, link, entries)
+
+    return StreamingHttpResponse(
+        generate(), content_type=CONTENT_TYPES[fmt])
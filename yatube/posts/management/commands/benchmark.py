@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Замеряет время, число запросов и размер ответа всех '
+            'страниц posts/urls.py и сравнивает с базовым прогоном')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Запросов к каждой странице')
+        parser.add_argument('--cold', action='store_true',
+                            help='Очищать кэш перед каждым запросом '
+                                 '(очищает и общий кэш сайта)')
+        parser.add_argument('--anonymous', action='store_true',
+                            help='Обходить страницы без входа на сайт')
+        parser.add_argument('--query', default='кошка',
+                            help='Строка для страницы поиска')
+        parser.add_argument('--url', action='append', default=[],
+                            help='Дополнительный адрес для замера')
+        parser.add_argument('--save', metavar='PATH',
+                            help='Сохранить результаты как базовые')
+        parser.add_argument('--baseline', metavar='PATH',
+                            help='Сравнить с сохранёнными результатами')
+        parser.add_argument('--tolerance', type=float,
+                            default=benchmark.TOLERANCE,
+                            help='Допустимый рост медианы, доля')
+
+    def handle(self, *args, **options):
+        results = benchmark.run(
+            repeat=options['repeat'],
+            cold=options['cold'],
+            anonymous=options['anonymous'],
+            query=options['query'],
+            extra=options['url'],
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<18} {result["status"]} '
+                + ' '.join(f'p{rank} {result[f"p{rank}"]:7.1f} мс'
+                           for rank in benchmark.PERCENTILES)
+                + f' запросов {result["queries"]:3} '
+                f'байт {result["bytes"]:8}  {result["url"]}'
+            )
+        if options['save']:
+            benchmark.save(results, options['save'])
+        if options['baseline']:
+            regressions = benchmark.compare(
+                results, benchmark.load(options['baseline']),
+                options['tolerance'])
+            if regressions:
+                raise CommandError(
+                    'Хуже базового прогона:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('Регрессий нет'))
@@ -0,0 +1,64 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from posts import bulk
+
+
+def since_type(value):
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        moment = datetime.datetime(day.year, day.month, day.day)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class Command(BaseCommand):
+    help = ('Выгружает пользователей, группы, посты, комментарии '
+            'или подписки в JSONL/CSV (можно .gz) порциями по id')
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(bulk.EXPORTS))
+        parser.add_argument(
+            'path', help='Файл .jsonl или .csv (можно .gz), - для stdout')
+        parser.add_argument('--format', choices=bulk.FORMATS,
+                            help='Формат файла, по умолчанию по расширению')
+        parser.add_argument('--since', type=since_type,
+                            help='Только записи, созданные начиная '
+                                 'с этой даты (ISO 8601)')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Потоков выгрузки; каждый пишет свой '
+                                 'диапазон id в отдельный файл')
+        parser.add_argument('--chunk-size', type=int,
+                            default=bulk.EXPORT_CHUNK_SIZE,
+                            help='Строк в одном запросе')
+        parser.add_argument('--include-passwords', action='store_true',
+                            help='Выгрузить хэши паролей пользователей '
+                                 '(по умолчанию не выгружаются)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if options['workers'] > 1 and path == '-':
+            raise CommandError('Параллельная выгрузка пишет только в файлы')
+        try:
+            progress = bulk.export(
+                options['kind'], path,
+                options['format'] or bulk.detect_format(path),
+                since=options['since'],
+                workers=options['workers'],
+                chunk_size=options['chunk_size'],
+                passwords=options['include_passwords'],
+            )
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+        # Выгрузка в stdout не должна смешиваться с отчётом
+        out = self.stderr if path == '-' else self.stdout
+        out.write(self.style.SUCCESS(
+            f'Выгружено {progress.rows} строк '
+            f'({progress.rate:.0f} строк/с)'))
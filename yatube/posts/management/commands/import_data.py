@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from posts import bulk
+
+
+class Command(BaseCommand):
+    help = ('Загружает пользователей, группы, посты, комментарии '
+            'или подписки из JSONL/CSV пачками bulk_create')
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(bulk.KINDS))
+        parser.add_argument(
+            'path', help='Файл .jsonl или .csv (можно .gz), - для stdin')
+        parser.add_argument('--format', choices=bulk.FORMATS,
+                            help='Формат файла, по умолчанию по расширению')
+        parser.add_argument('--batch-size', type=int,
+                            default=bulk.BATCH_SIZE,
+                            help='Строк в одном INSERT')
+        parser.add_argument('--transaction-size', type=int,
+                            default=bulk.TRANSACTION_SIZE,
+                            help='Строк в одной транзакции')
+        parser.add_argument('--ignore-conflicts', action='store_true',
+                            help='Пропускать строки, нарушающие уникальность')
+        parser.add_argument('--no-rebuild', action='store_false',
+                            dest='rebuild',
+                            help='Не пересчитывать счётчики, ленты и поиск '
+                                 '(например, до загрузки следующего файла)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or bulk.detect_format(path)
+
+        # Progress загрузки, если хоть одна транзакция зафиксирована
+        # или загрузка завершилась
+        committed = []
+
+        def report(progress):
+            committed[:] = [progress]
+            if options['verbosity'] > 1:
+                self.stdout.write(
+                    f'{progress.rows} строк, {progress.rate:.0f} строк/с')
+
+        try:
+            with bulk.open_input(path) as stream:
+                progress = bulk.import_rows(
+                    options['kind'],
+                    bulk.read_rows(stream, fmt),
+                    batch_size=options['batch_size'],
+                    transaction_size=options['transaction_size'],
+                    ignore_conflicts=options['ignore_conflicts'],
+                    on_commit=report,
+                )
+            committed[:] = [progress]
+            self.stdout.write(self.style.SUCCESS(
+                f'Загружено {progress.rows} строк '
+                f'({progress.rate:.0f} строк/с)'))
+        except (OSError, ValueError, IntegrityError) as error:
+            if committed:
+                error = (f'{error}. Строк до ошибки уже загружено: '
+                         f'{committed[0].rows}')
+            raise CommandError(error)
+        finally:
+            # Зафиксированные строки нужно учесть и после ошибки
+            if options['rebuild'] and committed:
+                bulk.rebuild_derived()
+                self.stdout.write(self.style.SUCCESS(
+                    'Счётчики, ленты подписок и поиск пересчитаны'))
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+
+from posts import bulk
+from posts.seeding import Seeder
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу правдоподобными данными: степенное '
+            'распределение подписчиков, длинные обсуждения, картинки')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=50000)
+        parser.add_argument('--follows', type=int, default=20,
+                            help='Среднее число подписок пользователя')
+        parser.add_argument('--image-ratio', type=float, default=0.05,
+                            help='Доля постов с картинкой')
+        parser.add_argument('--alpha', type=float, default=1.2,
+                            help='Показатель степенного закона '
+                                 'популярности авторов и постов')
+        parser.add_argument('--days', type=int, default=365,
+                            help='За сколько дней распределить посты')
+        parser.add_argument('--prefix', default='seed',
+                            help='Префикс имён пользователей и slug групп')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Зерно генератора случайных чисел')
+        parser.add_argument('--batch-size', type=int,
+                            default=bulk.BATCH_SIZE)
+        parser.add_argument('--transaction-size', type=int,
+                            default=bulk.TRANSACTION_SIZE)
+
+    def handle(self, *args, **options):
+        def report(progress):
+            if options['verbosity'] > 1:
+                self.stdout.write(
+                    f'{progress.rows} строк, {progress.rate:.0f} строк/с')
+
+        Seeder(
+            users=options['users'],
+            groups=options['groups'],
+            posts=options['posts'],
+            comments=options['comments'],
+            follows=options['follows'],
+            image_ratio=options['image_ratio'],
+            alpha=options['alpha'],
+            days=options['days'],
+            prefix=options['prefix'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            transaction_size=options['transaction_size'],
+            on_commit=report,
+        ).run()
+        self.stdout.write(self.style.SUCCESS('База заполнена'))
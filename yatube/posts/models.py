@@ -14,6 +14,19 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    # Поля, которые выводит карточка поста в лентах
+    FEED_FIELDS = (
+        'id', 'text', 'created', 'image', 'author', 'group',
+        'author__username', 'author__first_name', 'author__last_name',
+        'group__title', 'group__slug', 'comments_count',
+    )
+
+    def for_feed(self):
+        """Посты для лент: автор и группа приходят одним запросом."""
+        return self.select_related('author', 'group').only(*self.FEED_FIELDS)
+
+
 class Post(CreatedModel):
     MAX_LEN: int = 15
     text = models.TextField(
@@ -41,9 +54,23 @@ class Post(CreatedModel):
         upload_to='posts/',
         blank=True
     )
+    comments_count = models.PositiveIntegerField(
+        'Комментариев',
+        default=0,
+        editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
-        ordering = ('-created',)
+        ordering = ('-created', '-pk')
+        indexes = [
+            models.Index(fields=['-created', '-id'], name='post_created'),
+            models.Index(fields=['author', '-created', '-id'],
+                         name='post_author_created'),
+            models.Index(fields=['group', '-created', '-id'],
+                         name='post_group_created'),
+        ]
 
     def __str__(self):
         return self.text[:self.MAX_LEN]
@@ -70,6 +97,12 @@ class Comment(models.Model):
         auto_now_add=True
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created'],
+                         name='comment_post_created'),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -82,9 +115,61 @@ class Follow(models.Model):
         on_delete=models.CASCADE,
         related_name='following'
     )
+    # False - посты автора не раскладываются по лентам подписчиков,
+    # а читаются при открытии ленты (fan-out-on-read)
+    fanout = models.BooleanField(default=True)
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['user', 'author'],
                                     name='unique_following')
         ]
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """Пост в материализованной ленте подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    created = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='unique_timeline_entry')
+        ]
+        indexes = [
+            models.Index(fields=['user', '-created', '-post'],
+                         name='timeline_user_created'),
+            models.Index(fields=['user', 'author'],
+                         name='timeline_user_author'),
+        ]
+
+
+class UserStats(models.Model):
+    """Счётчики пользователя. Обновляются вместе с постами и подписками."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
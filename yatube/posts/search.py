@@ -0,0 +1,163 @@
+"""Полнотекстовый поиск по постам.
+
+Текст поста раскладывается на основы слов (стеммер Портера для русского
+языка) и хранится в таблице SQLite FTS5 posts_post_fts с rowid = id поста.
+Индекс обновляется сигналами сохранения и удаления Post, результаты
+ранжируются по bm25. На других СУБД поиск сводится к icontains.
+"""
+import re
+
+from django.db import connection
+
+from .models import Post
+
+FTS_TABLE = 'posts_post_fts'
+# Сколько лучших результатов отдаёт поиск
+SEARCH_LIMIT = 1000
+
+RV = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+PERFECTIVE_GERUND = re.compile(
+    r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+REFLEXIVE = re.compile(r'(с[яь])$')
+ADJECTIVE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|'
+    r'ую|юю|ая|яя|ою|ею)$')
+PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|'
+    r'ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)|'
+    r'((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$')
+NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|'
+    r'ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$')
+DERIVATIONAL = re.compile(
+    r'.*[^аеиоуыэюя]+[аеиоуыэюя]+[^аеиоуыэюя]+[аеиоуыэюя]+.*ость?$')
+DERIVATIONAL_ENDING = re.compile(r'ость?$')
+SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+WORD = re.compile(r'\w+')
+CYRILLIC = re.compile(r'[а-я]')
+
+
+def stem(word):
+    """Основа русского слова по алгоритму Портера (Snowball)."""
+    word = word.lower().replace('ё', 'е')
+    match = RV.match(word)
+    if not match:
+        return word
+    prefix, rv = match.groups()
+    ending = PERFECTIVE_GERUND.sub('', rv, 1)
+    if ending != rv:
+        rv = ending
+    else:
+        rv = REFLEXIVE.sub('', rv, 1)
+        ending = ADJECTIVE.sub('', rv, 1)
+        if ending != rv:
+            rv = PARTICIPLE.sub('', ending, 1)
+        else:
+            ending = VERB.sub('', rv, 1)
+            rv = ending if ending != rv else NOUN.sub('', rv, 1)
+    if rv.endswith('и'):
+        rv = rv[:-1]
+    if DERIVATIONAL.match(rv):
+        rv = DERIVATIONAL_ENDING.sub('', rv, 1)
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    else:
+        ending = SUPERLATIVE.sub('', rv, 1)
+        if ending != rv:
+            rv = ending[:-1] if ending.endswith('нн') else ending
+        elif rv.endswith('ь'):
+            rv = rv[:-1]
+    return prefix + rv
+
+
+def stems(text):
+    return [
+        stem(word) if CYRILLIC.search(word) else word
+        for word in WORD.findall(text.lower())
+    ]
+
+
+def has_index():
+    return connection.vendor == 'sqlite'
+
+
+def index_post(post):
+    if not has_index():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, stems) VALUES (%s, %s)',
+            [post.pk, ' '.join(stems(post.text))]
+        )
+
+
+def unindex_post(pk):
+    if not has_index():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [pk])
+
+
+def rebuild():
+    """Строит индекс заново по всем постам."""
+    if not has_index():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        rows = Post.objects.values_list('pk', 'text').order_by('pk')
+        batch = []
+        for pk, text in rows.iterator():
+            batch.append((pk, ' '.join(stems(text))))
+            if len(batch) == 500:
+                cursor.executemany(
+                    f'INSERT INTO {FTS_TABLE} (rowid, stems) '
+                    f'VALUES (%s, %s)', batch)
+                batch = []
+        if batch:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, stems) VALUES (%s, %s)',
+                batch)
+
+
+def match_expression(terms):
+    words = ' '.join('"{}"'.format(term.replace('"', '""'))
+                     for term in terms)
+    return f'stems: ({words})'
+
+
+def search_ids(query, limit=SEARCH_LIMIT):
+    """id постов по запросу, от наиболее подходящих к наименее."""
+    terms = stems(query)
+    if not terms:
+        return []
+    if not has_index():
+        posts = Post.objects.all()
+        for word in WORD.findall(query):
+            posts = posts.filter(text__icontains=word)
+        return list(posts.values_list('pk', flat=True)[:limit])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+            f'ORDER BY rank LIMIT %s', [match_expression(terms), limit])
+        return [pk for (pk,) in cursor.fetchall()]
+
+
+def filter_posts(queryset, query):
+    """Все посты queryset, подходящие под запрос, без SEARCH_LIMIT.
+
+    Индекс проверяется подзапросом в той же выборке, поэтому
+    id найденных постов не передаются параметрами.
+    """
+    terms = stems(query)
+    if not terms:
+        return queryset.none()
+    if not has_index():
+        for word in WORD.findall(query):
+            queryset = queryset.filter(text__icontains=word)
+        return queryset
+    return queryset.extra(
+        where=[f'{Post._meta.db_table}.id IN (SELECT rowid FROM {FTS_TABLE} '
+               f'WHERE {FTS_TABLE} MATCH %s)'],
+        params=[match_expression(terms)])
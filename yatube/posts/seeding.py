@@ -0,0 +1,180 @@
+"""Генератор правдоподобных данных для нагрузочных проверок.
+
+Популярность авторов и постов распределена по степенному закону:
+немногие авторы собирают большую часть подписчиков и пишут больше
+всех, а немногие посты собирают длинные обсуждения. Часть постов
+получает картинки из небольшого набора сгенерированных файлов.
+"""
+import io
+import random
+from itertools import accumulate
+
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image
+
+from . import bulk, thumbnails
+from .models import Comment, Follow, Group, Post, User
+
+WORDS = (
+    'кошка собака дом город река лес море небо солнце дождь снег ветер '
+    'книга письмо дорога поезд окно сад дерево цветок утро вечер ночь '
+    'друг время жизнь работа мысль слово вопрос ответ история память '
+    'новый старый тихий быстрый светлый тёмный большой маленький '
+    'читать писать думать идти смотреть говорить любить помнить ждать'
+).split()
+FIRST_NAMES = ('Анна', 'Борис', 'Вера', 'Глеб', 'Дарья', 'Егор', 'Жанна',
+               'Илья', 'Ксения', 'Лев', 'Мария', 'Никита', 'Ольга', 'Пётр')
+LAST_NAMES = ('Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов',
+              'Лебедев', 'Козлов', 'Новиков', 'Морозов', 'Волков')
+IMAGE_POOL: int = 12
+IMAGE_SIZE = (960, 540)
+
+
+class PowerLaw:
+    """Случайные индексы 0..n-1 с весами 1 / (rank + 1) ** alpha."""
+
+    def __init__(self, rng, n, alpha):
+        self.rng = rng
+        self.population = range(n)
+        self.cum_weights = list(
+            accumulate(1 / (rank + 1) ** alpha for rank in range(n)))
+
+    def sample(self, k=1):
+        return self.rng.choices(
+            self.population, cum_weights=self.cum_weights, k=k)
+
+    def one(self):
+        return self.sample()[0]
+
+
+class Seeder:
+    """Заполняет базу и пересчитывает производные данные.
+
+    Лишние именованные параметры (batch_size, transaction_size,
+    on_commit) передаются в bulk.insert_objects.
+    """
+
+    def __init__(self, users=1000, groups=20, posts=20000, comments=50000,
+                 follows=20, image_ratio=0.05, alpha=1.2, days=365,
+                 prefix='seed', seed=0, **insert_options):
+        self.rng = random.Random(seed)
+        self.users = users
+        self.groups = groups
+        self.posts = posts
+        self.comments = comments
+        self.follows = follows
+        self.image_ratio = image_ratio
+        self.alpha = alpha
+        self.days = days
+        self.prefix = prefix
+        self.insert_options = insert_options
+        self.now = timezone.now()
+
+    def text(self, low, high):
+        words = self.rng.choices(WORDS, k=self.rng.randint(low, high))
+        return ' '.join(words).capitalize() + '.'
+
+    def created(self):
+        return self.now - timezone.timedelta(
+            seconds=self.rng.uniform(0, self.days * 24 * 3600))
+
+    def insert(self, model, objects, **options):
+        return bulk.insert_objects(
+            model, objects, **{**self.insert_options, **options})
+
+    def seed_users(self):
+        password = UNUSABLE_PASSWORD_PREFIX + 'seed'
+        self.insert(User, (
+            User(username=f'{self.prefix}_{i}', password=password,
+                 first_name=self.rng.choice(FIRST_NAMES),
+                 last_name=self.rng.choice(LAST_NAMES))
+            for i in range(self.users)
+        ))
+        ids = list(User.objects.filter(
+            username__startswith=f'{self.prefix}_'
+        ).values_list('pk', flat=True))
+        # Популярность не должна совпадать с порядком регистрации
+        self.rng.shuffle(ids)
+        return ids
+
+    def seed_groups(self):
+        self.insert(Group, (
+            Group(title=f'Группа {i}', slug=f'{self.prefix}-{i}',
+                  description=self.text(5, 20))
+            for i in range(self.groups)
+        ))
+        return list(Group.objects.filter(
+            slug__startswith=f'{self.prefix}-'
+        ).values_list('pk', flat=True))
+
+    def seed_images(self):
+        names = []
+        for i in range(IMAGE_POOL):
+            name = f'posts/{self.prefix}_{i}.jpg'
+            if not default_storage.exists(name):
+                color = tuple(self.rng.randrange(256) for _ in range(3))
+                buffer = io.BytesIO()
+                Image.new('RGB', IMAGE_SIZE, color).save(buffer, 'JPEG')
+                name = default_storage.save(
+                    name, ContentFile(buffer.getvalue()))
+            thumbnails.generate(name)
+            names.append(name)
+        return names
+
+    def seed_follows(self, user_ids):
+        authors = PowerLaw(self.rng, len(user_ids), self.alpha)
+
+        def follows():
+            for user_id in user_ids:
+                count = min(len(user_ids) - 1,
+                            int(self.rng.expovariate(1 / self.follows)))
+                followed = {user_ids[i] for i in authors.sample(count)}
+                followed.discard(user_id)
+                for author_id in followed:
+                    yield Follow(user_id=user_id, author_id=author_id)
+
+        self.insert(Follow, follows(), ignore_conflicts=True)
+
+    def seed_posts(self, user_ids, group_ids, images):
+        authors = PowerLaw(self.rng, len(user_ids), self.alpha)
+        groups = PowerLaw(self.rng, len(group_ids), self.alpha)
+        first = (Post.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+        def posts():
+            for _ in range(self.posts):
+                with_group = group_ids and self.rng.random() < 0.7
+                with_image = images and self.rng.random() < self.image_ratio
+                yield Post(
+                    author_id=user_ids[authors.one()],
+                    group_id=group_ids[groups.one()] if with_group else None,
+                    text=self.text(5, 80),
+                    image=self.rng.choice(images) if with_image else '',
+                    created=self.created(),
+                )
+
+        self.insert(Post, posts())
+        return list(Post.objects.filter(pk__gte=first).values_list(
+            'pk', flat=True))
+
+    def seed_comments(self, user_ids, post_ids):
+        threads = PowerLaw(self.rng, len(post_ids), self.alpha)
+        self.insert(Comment, (
+            Comment(post_id=post_ids[threads.one()],
+                    author_id=self.rng.choice(user_ids),
+                    text=self.text(2, 30), created=self.created())
+            for _ in range(self.comments)
+        ))
+
+    def run(self):
+        user_ids = self.seed_users()
+        group_ids = self.seed_groups()
+        images = self.seed_images() if self.image_ratio else []
+        self.seed_follows(user_ids)
+        post_ids = self.seed_posts(user_ids, group_ids, images)
+        if post_ids:
+            self.seed_comments(user_ids, post_ids)
+        bulk.rebuild_derived()
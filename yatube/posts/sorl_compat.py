@@ -0,0 +1,46 @@
+"""Закрытые части sorl-thumbnail, нужные пакетному чтению миниатюр.
+
+Публичный API sorl отдаёт миниатюры по одной: get_thumbnail на каждую
+карточку ходит в хранилище отдельно. Чтобы прочитать страницу одним
+запросом, thumbnails.py повторяет расчёт имени файла и ключа хранилища
+sorl, а для этого нужны его внутренние функции. Все они собраны здесь,
+а ThumbnailTest в posts/tests/test_views.py сверяет результат
+с настоящим get_thumbnail. Версия sorl закреплена в requirements.txt.
+"""
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE  # noqa: F401
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as CachedDB
+
+
+def thumbnail_options(source, options):
+    """Опции с умолчаниями sorl - как в ThumbnailBackend.get_thumbnail."""
+    backend = default.backend
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return options
+
+
+def thumbnail_name(source, geometry, options):
+    """Имя файла, под которым get_thumbnail сохранит миниатюру."""
+    return default.backend._get_thumbnail_filename(
+        source, geometry, thumbnail_options(source, options))
+
+
+def storage_key(image_file):
+    """Ключ записи о миниатюре в кэше и таблице хранилища sorl."""
+    return add_prefix(image_file.key)
+
+
+def is_cached_db(kvstore):
+    """Хранилище - стандартное cached_db, которое читается пакетно."""
+    return isinstance(kvstore, CachedDB)
@@ -0,0 +1,20 @@
+from django import template
+
+from core import timing
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def lazy_thumbnail(image, geometry, **options):
+    """Готовая миниатюра или None - тогда шаблон выводит заглушку.
+
+    Если миниатюры нет (например, у старого поста), она ставится
+    в очередь и появится на следующих открытиях страницы.
+    """
+    with timing.phase('thumbnail'):
+        thumbnail = thumbnails.ready(image, geometry, **options)
+    if thumbnail is None and image:
+        thumbnails.schedule(image)
+    return thumbnail
@@ -0,0 +1,294 @@
+import gzip
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+
+from core.testing import TempMediaMixin
+from posts import benchmark, bulk, caching, search, urls
+from posts.models import (Comment, Follow, Group, Post, TimelineEntry,
+                          UserStats)
+
+User = get_user_model()
+
+
+class ImportDataTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write(self, name, rows=None, text=None):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            if text is not None:
+                file.write(text)
+            for row in rows or []:
+                file.write(json.dumps(row, ensure_ascii=False) + '\n')
+        return path
+
+    def load(self, kind, path, *args):
+        call_command('import_data', kind, path, *args, stdout=StringIO())
+
+    def test_import_all_kinds(self):
+        """Загрузка из JSONL и CSV пересчитывает счётчики, ленты и поиск."""
+        self.load('users', self.write('users.csv', text=(
+            'username,first_name,last_name\n'
+            'leo,Лев,Толстой\n'
+            'anna,Анна,\n'
+        )))
+        self.load('groups', self.write('groups.jsonl', [
+            {'title': 'Проза', 'slug': 'prose', 'description': 'Романы'},
+        ]))
+        self.load('follows', self.write('follows.jsonl', [
+            {'user': 'anna', 'author': 'leo'},
+            {'user': 'anna', 'author': 'leo'},
+        ]), '--no-rebuild')
+        self.load('posts', self.write('posts.jsonl', [
+            {'id': 100 + i, 'author': 'leo', 'group': 'prose',
+             'text': f'Глава {i} о кошках', 'created': f'1869-01-0{i}T12:00'}
+            for i in range(1, 4)
+        ]), '--batch-size', '2', '--transaction-size', '2', '--no-rebuild')
+        self.load('comments', self.write('comments.jsonl', [
+            {'post': 101, 'author': 'anna', 'text': 'Прекрасно'},
+        ]))
+
+        leo = User.objects.get(username='leo')
+        self.assertFalse(leo.has_usable_password())
+        self.assertEqual(Follow.objects.count(), 1)
+        posts = Post.objects.filter(author=leo, group__slug='prose')
+        self.assertEqual(posts.count(), 3)
+        self.assertEqual(posts.first().created.year, 1869)
+        self.assertEqual(Post.objects.get(pk=101).comments_count, 1)
+        self.assertEqual(leo.stats.posts_count, 3)
+        self.assertEqual(leo.stats.followers_count, 1)
+        self.assertEqual(
+            TimelineEntry.objects.filter(user__username='anna').count(), 3)
+        if search.has_index():
+            self.assertEqual(len(search.search_ids('кошками')), 3)
+        self.assertEqual(Comment.objects.get().post_id, 101)
+
+    def test_unknown_author(self):
+        path = self.write('posts.jsonl', [{'author': 'ghost', 'text': 'Т'}])
+        with self.assertRaisesMessage(CommandError, 'Строка 1'):
+            self.load('posts', path)
+        self.assertFalse(Post.objects.exists())
+
+    def test_missing_field(self):
+        path = self.write('groups.jsonl', [{'slug': 'h'}])
+        with self.assertRaisesMessage(CommandError, "нет поля 'title'"):
+            self.load('groups', path)
+
+    def test_empty_field(self):
+        User.objects.create_user(username='anna')
+        path = self.write('comments.jsonl', [
+            {'post': None, 'author': 'anna', 'text': 'Т'}])
+        with self.assertRaisesMessage(CommandError, "Пустое поле 'post'"):
+            self.load('comments', path)
+
+    def test_bad_rows_report_line(self):
+        """Неверный JSON и не-объект - ошибка с номером строки файла."""
+        for text, line in (
+            ('{"slug": "a", "title": "А"}\n\n{"slug": \n', 'Строка 3'),
+            ('{"slug": "a", "title": "А"}\n[1, 2]\n', 'Строка 2'),
+            ('"x"\n', 'Строка 1'),
+        ):
+            with self.subTest(text=text):
+                path = self.write('groups.jsonl', text=text)
+                with self.assertRaisesMessage(CommandError, line):
+                    self.load('groups', path)
+        self.assertFalse(Group.objects.exists())
+
+    def test_failure_after_commit_rebuilds(self):
+        """Строки из зафиксированных транзакций учтены и при ошибке."""
+        leo = User.objects.create_user(username='leo')
+        path = self.write('posts.jsonl', [
+            {'author': 'leo', 'text': 'Первый'},
+            {'author': 'ghost', 'text': 'Второй'},
+        ])
+        with self.assertRaisesMessage(CommandError, 'уже загружено: 1'):
+            self.load('posts', path, '--transaction-size', '1')
+        self.assertEqual(Post.objects.get().text, 'Первый')
+        self.assertEqual(UserStats.objects.get(user=leo).posts_count, 1)
+
+    def test_created_kept_without_touching_fields(self):
+        """Дата из файла сохраняется, auto_now_add модели не меняется."""
+        User.objects.create_user(username='leo')
+        self.load('posts', self.write('posts.jsonl', [
+            {'author': 'leo', 'text': 'Т', 'created': '1869-01-01T12:00'},
+            {'author': 'leo', 'text': 'Без даты'},
+        ]))
+        self.assertEqual(Post.objects.get(text='Т').created.year, 1869)
+        self.assertEqual(Post.objects.get(text='Без даты').created.date(),
+                         timezone.now().date())
+        self.assertTrue(Post._meta.get_field('created').auto_now_add)
+
+
+class ExportDataTest(TransactionTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.author = User.objects.create_user(username='writer')
+        group = Group.objects.create(title='Г', slug='g', description='')
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f'Пост {i}',
+                 group=group if i % 2 else None)
+            for i in range(25)
+        )
+        Post.objects.filter(text='Пост 0').update(
+            created=timezone.now() - timezone.timedelta(days=30))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def read(self, path):
+        with gzip.open(path, 'rt', encoding='utf-8') as file:
+            return [json.loads(line) for line in file]
+
+    def export(self, *args):
+        call_command('export_data', *args, stdout=StringIO())
+
+    def test_export_posts(self):
+        path = os.path.join(self.directory, 'posts.jsonl.gz')
+        self.export('posts', path, '--chunk-size', '7')
+        rows = self.read(path)
+        self.assertEqual(len(rows), 25)
+        self.assertEqual([row['id'] for row in rows],
+                         sorted(row['id'] for row in rows))
+        self.assertEqual(rows[1]['author'], 'writer')
+        self.assertEqual(rows[1]['group'], 'g')
+        self.assertEqual(rows[0]['group'], '')
+
+    def test_export_since(self):
+        path = os.path.join(self.directory, 'posts.csv')
+        since = (timezone.now() - timezone.timedelta(days=1)).isoformat()
+        self.export('posts', path, '--since', since)
+        with open(path, encoding='utf-8') as file:
+            lines = file.read().splitlines()
+        self.assertEqual(lines[0], 'id,author,group,text,image,created')
+        self.assertEqual(len(lines), 25)
+
+    def test_parallel_export(self):
+        """Части по диапазонам id вместе дают всю таблицу."""
+        path = os.path.join(self.directory, 'posts.jsonl.gz')
+        self.export('posts', path, '--workers', '3', '--chunk-size', '4')
+        ids = []
+        for number in range(1, 4):
+            ids += [row['id'] for row in self.read(
+                os.path.join(self.directory, f'posts.{number}.jsonl.gz'))]
+        self.assertEqual(sorted(ids),
+                         sorted(Post.objects.values_list('pk', flat=True)))
+
+    def test_export_then_import(self):
+        path = os.path.join(self.directory, 'follows.jsonl.gz')
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=self.author)
+        self.export('follows', path)
+        Follow.objects.all().delete()
+        call_command('import_data', 'follows', path, stdout=StringIO())
+        self.assertTrue(
+            Follow.objects.filter(user=reader, author=self.author).exists())
+
+    def test_users_without_passwords(self):
+        """Хэши паролей выгружаются только с --include-passwords."""
+        self.author.set_password('secret')
+        self.author.save()
+        path = os.path.join(self.directory, 'users.jsonl.gz')
+        self.export('users', path)
+        self.assertNotIn('password', self.read(path)[0])
+        self.export('users', path, '--include-passwords')
+        self.assertEqual(self.read(path)[0]['password'],
+                         self.author.password)
+
+    def test_users_round_trip(self):
+        """Пользователи из выгрузки загружаются без пригодных паролей."""
+        path = os.path.join(self.directory, 'users.csv')
+        self.export('users', path)
+        Post.objects.all().delete()
+        User.objects.all().delete()
+        call_command('import_data', 'users', path, stdout=StringIO())
+        writer = User.objects.get(username='writer')
+        self.assertFalse(writer.has_usable_password())
+
+    def test_export_to_stdout_keeps_it_open(self):
+        buffer = io.BytesIO()
+        stdout = io.TextIOWrapper(buffer, encoding='utf-8')
+        with mock.patch('sys.stdout', stdout):
+            call_command('export_data', 'groups', '-', stderr=StringIO())
+            self.assertFalse(sys.stdout.closed)
+        rows = [json.loads(line) for line in buffer.getvalue().splitlines()]
+        self.assertEqual([row['slug'] for row in rows], ['g'])
+
+
+class PartPathTest(SimpleTestCase):
+    def test_part_path(self):
+        for path, part in (
+            ('posts.jsonl.gz', 'posts.2.jsonl.gz'),
+            ('out/my.export.csv', 'out/my.export.2.csv'),
+            ('my.export.jsonl.gz', 'my.export.2.jsonl.gz'),
+            ('dump', 'dump.2'),
+        ):
+            with self.subTest(path=path):
+                self.assertEqual(bulk.part_path(path, 2), part)
+
+
+class SeedAndBenchmarkTest(TempMediaMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        call_command('seed_data', '--users', '40', '--groups', '3',
+                     '--posts', '200', '--comments', '400',
+                     '--image-ratio', '0.1', stdout=StringIO())
+
+    def test_seeded_data(self):
+        self.assertEqual(User.objects.count(), 40)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 400)
+        self.assertTrue(Post.objects.exclude(image='').exists())
+        followers = list(UserStats.objects.order_by(
+            '-followers_count').values_list('followers_count', flat=True))
+        # Степенной закон: самый популярный автор далеко впереди медианы
+        self.assertGreater(followers[0], 3 * followers[len(followers) // 2])
+        self.assertEqual(
+            TimelineEntry.objects.count(),
+            sum(Post.objects.filter(author=follow.author).count()
+                for follow in Follow.objects.all())
+        )
+
+    def test_benchmark_covers_all_urls(self):
+        """Замеряются все страницы, кроме меняющих данные."""
+        path = os.path.join(self.media_root, 'baseline.json')
+        follows = Follow.objects.count()
+        follows_version = caching.get_versions(
+            [('follows', benchmark.viewer().pk)])
+        call_command('benchmark', '--repeat', '2', '--save', path,
+                     stdout=StringIO())
+        results = benchmark.load(path)
+        self.assertEqual(
+            set(results),
+            {pattern.name for pattern in urls.urlpatterns}
+            - benchmark.MUTATING)
+        self.assertEqual(caching.get_versions(
+            [('follows', benchmark.viewer().pk)]), follows_version)
+        self.assertEqual(results['index']['status'], 200)
+        self.assertEqual(Follow.objects.count(), follows)
+        out = StringIO()
+        call_command('benchmark', '--repeat', '2', '--baseline', path,
+                     '--tolerance', '100', stdout=out)
+        self.assertIn('Регрессий нет', out.getvalue())
+
+    def test_baseline_regression(self):
+        regressions = benchmark.compare(
+            {'index': {'p50': 30.0, 'queries': 5}},
+            {'index': {'p50': 10.0, 'queries': 3}},
+        )
+        self.assertEqual(len(regressions), 2)
@@ -1,20 +1,17 @@
-import shutil
-import tempfile
-from django.conf import settings
+from unittest import mock
+
+from core.testing import TempMediaMixin
 from posts.forms import CommentForm, PostForm
 from posts.models import Post, Group, Comment
-from django.test import Client, TestCase, override_settings
+from django.test import Client, TestCase
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
 
 User = get_user_model()
 
-TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
-
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
-class PostCreateFormTests(TestCase):
+class PostCreateFormTests(TempMediaMixin, TestCase):
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
@@ -37,11 +34,6 @@ class PostCreateFormTests(TestCase):
         )
         cls.form = CommentForm()
 
-    @classmethod
-    def tearDownClass(cls):
-        super().tearDownClass()
-        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
-
     def setUp(self):
         self.guest_client = Client()
         self.authorized_client = Client()
@@ -172,3 +164,22 @@ class PostCreateFormTests(TestCase):
         updated_post = response.context['post'].text
         self.assertEqual(Post.objects.count(), posts_count)
         self.assertEqual(updated_post, 'Новый текст')
+
+    def test_edit_keeps_concurrent_comment_count(self):
+        """Правка поста не затирает счётчик комментариев."""
+        count = Post.objects.get(pk=self.post.pk).comments_count
+        clean_text = PostForm.clean_text
+
+        def comment_meanwhile(form):
+            Comment.objects.create(author=self.user, text='Параллельно',
+                                   post=self.post)
+            return clean_text(form)
+
+        with mock.patch.object(PostForm, 'clean_text', comment_meanwhile):
+            self.authorized_client.post(
+                reverse('posts:post_edit', kwargs={'post_id': self.post.pk}),
+                data={'text': 'Правка', 'group': self.group.pk},
+            )
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.text, 'Правка')
+        self.assertEqual(post.comments_count, count + 1)
@@ -0,0 +1,88 @@
+import base64
+
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Post
+from posts.utils import KEYSET, POSTS_ON_PAGE, KeysetPage, get_pages
+
+User = get_user_model()
+
+
+class KeysetPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='keyset')
+        Post.objects.bulk_create(
+            Post(author=cls.user, text=f'Пост {i}')
+            for i in range(POSTS_ON_PAGE * 2 + 5)
+        )
+        # у bulk_create одинаковое время создания - порядок решает id
+        cls.expected = list(
+            Post.objects.order_by('-created', '-pk').values_list(
+                'pk', flat=True)
+        )
+        cls.factory = RequestFactory()
+
+    def get_page(self, **params):
+        request = self.factory.get('/', params)
+        return get_pages(Post.objects.all(), request, mode=KEYSET)
+
+    def test_walk_forward_and_back(self):
+        """Курсоры обходят ленту без пропусков и повторов."""
+        page = self.get_page()
+        self.assertIsInstance(page, KeysetPage)
+        self.assertFalse(page.has_previous())
+        seen = [post.pk for post in page]
+        pages = [page]
+        while page.has_next():
+            page = self.get_page(after=page.next_cursor)
+            seen += [post.pk for post in page]
+            pages.append(page)
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(len(pages[-1]), 5)
+        previous = self.get_page(before=pages[-1].previous_cursor)
+        self.assertEqual(
+            [post.pk for post in previous], [post.pk for post in pages[-2]]
+        )
+        first = self.get_page(before=pages[1].previous_cursor)
+        self.assertFalse(first.has_previous())
+
+    def test_broken_cursor_gives_first_page(self):
+        """Испорченный курсор отдаёт первую страницу."""
+        page = self.get_page(after='не-курсор')
+        self.assertEqual(
+            [post.pk for post in page], self.expected[:POSTS_ON_PAGE]
+        )
+
+    def test_crafted_cursor_gives_first_page(self):
+        """Курсор без полного ключа или с огромным id - как мусор."""
+        created = Post.objects.get(pk=self.expected[0]).created.isoformat()
+        payloads = ('[null,null]', f'["{created}",null]',
+                    f'["{created}",{2 ** 70}]', f'["{created}",1e400]',
+                    '[1]', '{"a":1}', '"x"')
+        follower = User.objects.create_user(username='follower')
+        self.client.force_login(follower)
+        for payload in payloads:
+            cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+            with self.subTest(payload=payload):
+                page = self.get_page(after=cursor)
+                self.assertEqual(
+                    [post.pk for post in page], self.expected[:POSTS_ON_PAGE])
+                with override_settings(POSTS_PAGINATION=KEYSET):
+                    for url in (reverse('posts:index'),
+                                reverse('posts:follow_index')):
+                        response = self.client.get(url, {'after': cursor})
+                        self.assertEqual(response.status_code, 200)
+
+    @override_settings(POSTS_PAGINATION=KEYSET)
+    def test_view_uses_keyset_mode(self):
+        """Лента отдаёт курсорную страницу со ссылкой на следующую."""
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': 'keyset'})
+        )
+        page = response.context['page_obj']
+        self.assertIsInstance(page, KeysetPage)
+        self.assertContains(response, f'?after={page.next_cursor}')
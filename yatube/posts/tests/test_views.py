@@ -1,15 +1,38 @@
+import base64
+import json
+from xml.etree import ElementTree
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django import forms
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.models import KVStore
 
-from posts.models import Post, Group, Follow
-from posts.utils import POSTS_ON_PAGE
+from core.querybudget import QueryBudgetExceeded
+from core.testing import TempMediaMixin
+from posts import (benchmark, feeds, search, sorl_compat, thumbnails,
+                   urls)
+from posts.budgets import QUERY_BUDGETS, budget_for, budget_for_url
+from posts.models import Comment, Post, Group, Follow, TimelineEntry
+from posts.utils import COMMENTS_ON_PAGE, KEYSET, NUMBERED, POSTS_ON_PAGE
 
 User = get_user_model()
 
+TEST_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
 
 class PostPagesTests(TestCase):
     @classmethod
@@ -69,7 +92,8 @@ class PostPagesTests(TestCase):
         cache.clear()
         for reverse_name, template in templates_pages_names.items():
             with self.subTest(reverse_name=reverse_name):
-                response = self.authorized_client.get(reverse_name)
+                with budget_for_url(reverse_name):
+                    response = self.authorized_client.get(reverse_name)
                 self.assertTemplateUsed(response, template)
 
     def test_index_show_correct_context(self):
@@ -169,18 +193,33 @@ class PostPagesTests(TestCase):
         self.assertNotIn(post.pk, expected)
 
     def test_index_cache_check(self):
-        """Проверка кэша главной страницы"""
+        """Главная страница берётся из кэша до записи в ленту"""
         post_to_delete = Post.objects.create(
             author=self.user,
             text='Кэш пост',
         )
         response = self.authorized_client.get(reverse('posts:index'))
-        post_to_delete.delete()
+        Post.objects.filter(pk=post_to_delete.pk).update(text='Тихая правка')
         response_2 = self.authorized_client.get(reverse('posts:index'))
         self.assertEqual(response.content, response_2.content)
-        cache.clear()
+        post_to_delete.delete()
         response_3 = self.authorized_client.get(reverse('posts:index'))
         self.assertNotEqual(response.content, response_3.content)
+        self.assertNotContains(response_3, 'Кэш пост')
+
+    def test_cached_index_has_personal_header(self):
+        """Закэшированная главная показывает шапку текущего пользователя"""
+        other = User.objects.create_user(username='other_reader')
+        other_client = Client()
+        other_client.force_login(other)
+        guest_response = self.client.get(reverse('posts:index'))
+        self.assertContains(guest_response, 'Войти')
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Пользователь: author')
+        self.assertTemplateNotUsed(response, 'posts/index.html')
+        response = other_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Пользователь: other_reader')
+        self.assertNotContains(response, 'Пользователь: author')
 
 
 class PaginatorViewsTest(TestCase):
@@ -302,3 +341,544 @@ class FollowViewsTest(TestCase):
         response = self.authorized_client_2.get(template_page_name)
         expected = response.context['page_obj']
         self.assertNotIn(post.pk, expected)
+
+    def test_timeline_follows_subscriptions(self):
+        """Лента подписок заполняется, пополняется и чистится."""
+        Follow.objects.create(user=self.user, author=self.author)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user, post=self.post).exists())
+        new_post = Post.objects.create(author=self.author, text='Новый пост')
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            [post.pk for post in response.context['page_obj']],
+            [new_post.pk, self.post.pk]
+        )
+        self.authorized_client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': self.author}
+        ))
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user).exists())
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_large_author_is_read_on_demand(self):
+        """Посты крупных авторов подмешиваются в ленту при чтении."""
+        self.authorized_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.author}
+        ))
+        new_post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertFalse(TimelineEntry.objects.exists())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            [post.pk for post in response.context['page_obj']],
+            [new_post.pk, self.post.pk]
+        )
+
+
+class CommentPagesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='commenter')
+        cls.post = Post.objects.create(author=cls.user, text='Обсуждение')
+        cls.quiet_post = Post.objects.create(author=cls.user, text='Тихо')
+        Comment.objects.create(post=cls.quiet_post, author=cls.user,
+                               text='Единственный')
+        cls.readers = [
+            User.objects.create_user(username=f'reader_{i}')
+            for i in range(3)
+        ]
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.readers[i % 3],
+                    text=f'Комментарий {i}')
+            for i in range(COMMENTS_ON_PAGE + 5)
+        )
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def test_post_detail_shows_first_comments(self):
+        """На странице поста первая порция комментариев по порядку."""
+        response = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        comments = response.context['comments']
+        self.assertEqual(
+            [comment.text for comment in comments],
+            [f'Комментарий {i}' for i in range(COMMENTS_ON_PAGE)]
+        )
+        self.assertTrue(comments.has_next())
+        self.assertContains(response, comments.next_cursor)
+
+    def test_next_comments_chunk(self):
+        """Эндпоинт отдаёт следующую порцию комментариев."""
+        first = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        response = self.guest_client.get(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk}),
+            {'after': first.context['comments'].next_cursor}
+        )
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        self.assertTemplateNotUsed(response, 'base.html')
+        comments = response.context['comments']
+        self.assertEqual(
+            [comment.text for comment in comments],
+            [f'Комментарий {i}'
+             for i in range(COMMENTS_ON_PAGE, COMMENTS_ON_PAGE + 5)]
+        )
+        self.assertFalse(comments.has_next())
+
+    def test_crafted_comments_cursor(self):
+        """Курсор с null или огромным id отдаёт первую порцию, а не 500."""
+        url = reverse('posts:post_comments', kwargs={'post_id': self.post.pk})
+        for payload in ('[null,null]', f'["2020-01-01T00:00:00",{2 ** 70}]'):
+            cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+            with self.subTest(payload=payload):
+                response = self.guest_client.get(url, {'after': cursor})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    response.context['comments'][0].text, 'Комментарий 0')
+
+    def test_comments_of_missing_post(self):
+        response = self.guest_client.get(
+            reverse('posts:post_comments', kwargs={'post_id': 0}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_detail_queries_do_not_depend_on_comments(self):
+        """Страница поста стоит одинаково запросов при любом обсуждении."""
+        counts = []
+        for post in (self.quiet_post, self.post):
+            with budget_for('post_detail') as queries:
+                self.guest_client.get(reverse(
+                    'posts:post_detail', kwargs={'post_id': post.pk}))
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='etag_author')
+        cls.reader = User.objects.create_user(username='etag_reader')
+        cls.group = Group.objects.create(
+            title='Группа',
+            slug='etag',
+            description='Проверяем ETag',
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text='Пост', group=cls.group)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'etag'}),
+            reverse('posts:profile', kwargs={'username': 'etag_author'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+        ]
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_page_not_modified(self):
+        """Повторный запрос с ETag получает 304 без шаблонов."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                response = self.revalidate(url, etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+                self.assertEqual(response.templates, [])
+
+    def test_new_post_changes_etag(self):
+        etags = {url: self.client.get(url)['ETag'] for url in self.urls}
+        Follow.objects.create(user=self.reader, author=self.author)
+        Post.objects.create(author=self.author, text='Новый пост')
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                self.assertEqual(self.revalidate(url, etag).status_code, 200)
+
+    def test_follow_changes_etag(self):
+        urls = [
+            reverse('posts:profile', kwargs={'username': 'etag_author'}),
+            reverse('posts:follow_index'),
+        ]
+        etags = {url: self.client.get(url)['ETag'] for url in urls}
+        Follow.objects.create(user=self.reader, author=self.author)
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                self.assertEqual(self.revalidate(url, etag).status_code, 200)
+
+    def test_etag_depends_on_viewer(self):
+        url = reverse('posts:index')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(Client().get(url, HTTP_IF_NONE_MATCH=etag)
+                         .status_code, 200)
+
+
+class FeedsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='feeder')
+        cls.group = Group.objects.create(
+            title='Ленты',
+            slug='feeds',
+            description='Проверяем RSS',
+        )
+        Post.objects.bulk_create(
+            Post(author=cls.author, text=f'Пост <{i}> & текст',
+                 group=cls.group if i % 2 else None)
+            for i in range(feeds.FEED_ITEMS + 5)
+        )
+
+    def setUp(self):
+        self.client = Client()
+
+    def get(self, name, fmt, **kwargs):
+        response = self.client.get(
+            reverse(name, kwargs={**kwargs, 'fmt': fmt}))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_rss(self):
+        channel = ElementTree.fromstring(
+            self.get('posts:index_feed', 'rss')).find('channel')
+        titles = [item.findtext('title') for item in channel.iter('item')]
+        self.assertEqual(len(titles), feeds.FEED_ITEMS)
+        self.assertEqual(titles[0], f'Пост <{feeds.FEED_ITEMS + 4}> & текст')
+
+    def test_atom(self):
+        atom = '{http://www.w3.org/2005/Atom}'
+        root = ElementTree.fromstring(
+            self.get('posts:group_feed', 'atom', slug='feeds'))
+        entries = root.findall(f'{atom}entry')
+        self.assertEqual(len(entries), (feeds.FEED_ITEMS + 5) // 2)
+        self.assertEqual(
+            {entry.find(f'{atom}category').get('term')
+             for entry in entries},
+            {'Ленты'}
+        )
+
+    def test_json(self):
+        feed = json.loads(
+            self.get('posts:profile_feed', 'json', username='feeder'))
+        self.assertEqual(len(feed['items']), feeds.FEED_ITEMS)
+        self.assertEqual(feed['items'][0]['authors'], [{'name': 'feeder'}])
+
+    def test_unknown_format(self):
+        response = self.client.get(
+            reverse('posts:index_feed', kwargs={'fmt': 'yaml'}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_feed_not_modified(self):
+        url = reverse('posts:group_feed', kwargs={'slug': 'feeds',
+                                                  'fmt': 'rss'})
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='cached',
+                                            first_name='Старое')
+        cls.group = Group.objects.create(
+            title='Кэш-группа',
+            slug='cached',
+            description='Карточки из кэша',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Исходный текст',
+            group=cls.group,
+        )
+        cls.url = reverse('posts:group_list', kwargs={'slug': 'cached'})
+
+    def test_card_is_cached_until_post_changes(self):
+        """Карточка берётся из кэша, пока не изменится пост."""
+        cache.clear()
+        self.client.get(self.url)
+        Post.objects.filter(pk=self.post.pk).update(text='Тихая правка')
+        self.assertContains(self.client.get(self.url), 'Исходный текст')
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Новый текст'
+        post.save()
+        self.assertContains(self.client.get(self.url), 'Новый текст')
+
+    def test_card_follows_author_name(self):
+        """Смена имени автора обновляет закэшированную карточку."""
+        cache.clear()
+        self.assertContains(self.client.get(self.url), 'Старое')
+        self.user.first_name = 'Новое'
+        self.user.save()
+        self.assertContains(self.client.get(self.url), 'Новое')
+
+
+class ThumbnailTest(TempMediaMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='painter')
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(
+                name='thumb.gif', content=TEST_GIF, content_type='image/gif'
+            ),
+        )
+
+    def test_placeholder_until_thumbnail_is_ready(self):
+        """Пока миниатюры нет, выводится заглушка, а не синхронный ресайз"""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        cache.clear()
+        response = self.client.get(url)
+        self.assertContains(response, 'bg-light')
+        self.assertNotContains(response, '<img class="card-img')
+        thumbnails.generate(self.post.image.name)
+        self.assertIsNotNone(
+            thumbnails.ready(self.post.image, '960x339',
+                             crop='center', upscale=True)
+        )
+        response = self.client.get(url)
+        self.assertContains(response, '<img class="card-img')
+
+    def test_page_thumbnails_are_resolved_in_batch(self):
+        """Миниатюры всей страницы читаются одним запросом"""
+        thumbnails.generate(self.post.image.name)
+        posts = [Post.objects.get(pk=self.post.pk) for _ in range(3)]
+        cache.clear()
+        with self.assertNumQueries(1):
+            thumbnails.attach_thumbnails(posts)
+        with self.assertNumQueries(0):
+            thumbnails.attach_thumbnails(posts)
+        for post in posts:
+            self.assertTrue(post.thumbnail.url.startswith(settings.MEDIA_URL))
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': 'painter'}))
+        self.assertContains(response, posts[0].thumbnail.url)
+
+    def test_sorl_internals_match_get_thumbnail(self):
+        """Имя и ключ миниатюры совпадают с теми, что делает sorl.
+
+        Если тест упал после обновления sorl-thumbnail, его закрытый API
+        изменился: нужно поправить posts/sorl_compat.py.
+        """
+        geometry, options = thumbnails.CARD_GEOMETRY
+        cache.clear()
+        KVStore.objects.all().delete()
+        made = get_thumbnail(self.post.image, geometry, **options)
+        predicted = thumbnails.thumbnail_file(
+            self.post.image, geometry, options)
+        self.assertEqual(predicted.name, made.name)
+        self.assertTrue(sorl_compat.is_cached_db(default.kvstore))
+        self.assertTrue(KVStore.objects.filter(
+            key=sorl_compat.storage_key(predicted)).exists())
+        self.assertNotEqual(sorl_compat.EMPTY_VALUE,
+                            default.kvstore.cache.get(
+                                sorl_compat.storage_key(predicted)))
+
+
+class SearchViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='searcher')
+        cls.cats = Post.objects.create(
+            author=cls.user, text='Красивые кошки гуляют по крышам')
+        cls.dog = Post.objects.create(
+            author=cls.user, text='Собака бежала за кошкой')
+        cls.url = reverse('posts:search')
+
+    def found(self, query):
+        response = self.client.get(self.url, {'q': query})
+        self.assertTemplateUsed(response, 'posts/search.html')
+        return [post.pk for post in response.context['page_obj']]
+
+    def test_search_uses_word_forms(self):
+        """Поиск находит посты по другим формам слов"""
+        self.assertEqual(self.found('красивая кошка'), [self.cats.pk])
+        self.assertCountEqual(
+            self.found('кошками'), [self.cats.pk, self.dog.pk])
+        self.assertEqual(self.found('"жираф" OR'), [])
+
+    def test_index_follows_post_changes(self):
+        """Индекс обновляется при правке и удалении поста"""
+        dog = Post.objects.get(pk=self.dog.pk)
+        dog.text = 'Жираф ест листья'
+        dog.save()
+        self.assertEqual(self.found('кошка'), [self.cats.pk])
+        self.assertEqual(self.found('жирафы'), [dog.pk])
+        Post.objects.get(pk=self.cats.pk).delete()
+        self.assertEqual(self.found('кошка'), [])
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идёт через тот же индекс"""
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'крыша'})
+        self.assertEqual(
+            [post.pk for post in response.context['cl'].result_list],
+            [self.cats.pk]
+        )
+
+    def test_admin_search_is_not_limited(self):
+        """Админка находит все посты, а не SEARCH_LIMIT лучших"""
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f'Кошка номер {i}')
+            for i in range(search.SEARCH_LIMIT))
+        search.rebuild()
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'кошка'})
+        self.assertEqual(response.context['cl'].result_count,
+                         search.SEARCH_LIMIT + 2)
+
+
+class FeedQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.follower = User.objects.create_user(username='reader')
+        cls.authors = [
+            User.objects.create_user(username=f'writer_{i}',
+                                     first_name='Имя', last_name=f'{i}')
+            for i in range(3)
+        ]
+        cls.group = Group.objects.create(
+            title='Группа ленты',
+            slug='feed',
+            description='Проверяем число запросов',
+        )
+        Post.objects.bulk_create(
+            Post(author=cls.authors[i % 3], text=f'Пост {i}', group=cls.group)
+            for i in range(POSTS_ON_PAGE + 3)
+        )
+        for author in cls.authors:
+            Follow.objects.create(user=cls.follower, author=author)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.follower)
+
+    def count_queries(self, url):
+        cache.clear()
+        with budget_for_url(url) as queries:
+            response = self.authorized_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_feed_queries_do_not_depend_on_page_size(self):
+        """Полная и неполная страницы ленты стоят одинаково запросов."""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'feed'}),
+            reverse('posts:profile', kwargs={'username': 'writer_0'}),
+            reverse('posts:follow_index'),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(
+                    self.count_queries(url),
+                    self.count_queries(url + '?page=2'),
+                )
+
+    def bad_plans(self, url):
+        """Шаги плана выборок страницы с полным проходом или сортировкой."""
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_client.get(url)
+        bad = []
+        for query in queries:
+            if not query['sql'].startswith('SELECT'):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                for *_, detail in cursor.fetchall():
+                    # SCAN subquery - проход по уже отобранным строкам COUNT
+                    scan = (detail.startswith('SCAN')
+                            and 'INDEX' not in detail
+                            and detail != 'SCAN subquery')
+                    if scan or 'TEMP B-TREE' in detail:
+                        bad.append((detail, query['sql']))
+        return bad
+
+    def test_feed_queries_use_indexes(self):
+        """Ленты читаются по индексам: без SCAN таблиц и сортировок."""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:index') + '?page=2',
+            reverse('posts:group_list', kwargs={'slug': 'feed'}),
+            reverse('posts:profile', kwargs={'username': 'writer_0'}),
+            reverse('posts:post_detail',
+                    kwargs={'post_id': Post.objects.first().pk}),
+            reverse('posts:follow_index'),
+        ]
+        for mode in (NUMBERED, KEYSET):
+            with override_settings(POSTS_PAGINATION=mode):
+                for url in urls:
+                    with self.subTest(url=url, mode=mode):
+                        self.assertEqual(self.bad_plans(url), [])
+
+
+class QueryBudgetTest(TempMediaMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.follower = User.objects.create_user(username='reader')
+        authors = [User.objects.create_user(username=f'writer_{i}')
+                   for i in range(3)]
+        group = Group.objects.create(title='Г', slug='g', description='')
+        Post.objects.bulk_create(
+            Post(author=authors[i % 3], text=f'Пост {i}', group=group)
+            for i in range(POSTS_ON_PAGE + 3)
+        )
+        cls.post = Post.objects.first()
+        cls.post.image = SimpleUploadedFile(
+            'budget.gif', TEST_GIF, content_type='image/gif')
+        cls.post.save()
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=authors[0], text=f'К {i}')
+            for i in range(3)
+        )
+        for author in authors:
+            Follow.objects.create(user=cls.follower, author=author)
+
+    def get(self, client, name, url):
+        cache.clear()
+        with budget_for(name):
+            response = client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+
+    def test_every_url_has_budget(self):
+        self.assertEqual(set(QUERY_BUDGETS),
+                         {pattern.name for pattern in urls.urlpatterns})
+
+    def test_pages_within_budget(self):
+        """Все адреса posts/urls.py укладываются в бюджет запросов."""
+        reader = Client()
+        reader.force_login(self.follower)
+        author = Client()
+        author.force_login(self.post.author)
+        for name, url in benchmark.targets():
+            for client in (Client(), reader, author):
+                with self.subTest(name=name):
+                    self.get(client, name, url)
+
+    def test_report_shows_duplicates(self):
+        with self.assertRaises(QueryBudgetExceeded) as context:
+            with budget_for('post_comments'):
+                for post in Post.objects.all()[:3]:
+                    User.objects.get(pk=post.author_id)
+        message = str(context.exception)
+        self.assertIn('posts:post_comments: 4 запросов при бюджете 2',
+                      message)
+        self.assertIn('3 x SELECT', message)
@@ -0,0 +1,141 @@
+"""Миниатюры картинок постов.
+
+Все геометрии, которые выводят шаблоны, готовятся после сохранения поста
+в фоновом пуле потоков. Шаблоны только читают готовую миниатюру
+из хранилища sorl и, пока её нет, показывают заглушку.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core import timing
+
+from . import caching, sorl_compat
+
+logger = logging.getLogger(__name__)
+
+# Геометрии, которые используют шаблоны постов
+GEOMETRIES = (
+    ('960x339', {'crop': 'center', 'upscale': True}),
+)
+CARD_GEOMETRY = GEOMETRIES[0]
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def thumbnail_file(image, geometry, options):
+    """Файл миниатюры без обращения к хранилищу и картинке."""
+    name = sorl_compat.thumbnail_name(ImageFile(image), geometry, options)
+    return ImageFile(name, default.storage)
+
+
+def ready(image, geometry, **options):
+    """Готовая миниатюра или None, если её ещё не сделали."""
+    if not image:
+        return None
+    return default.kvstore.get(thumbnail_file(image, geometry, options))
+
+
+def _resolve_raw(keys):
+    """Значения хранилища sorl: один get_many к кэшу и один запрос в БД."""
+    kvstore = default.kvstore
+    values = kvstore.cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        stored = dict(KVStoreModel.objects.filter(
+            key__in=missing).values_list('key', 'value'))
+        fetched = {key: stored.get(key, sorl_compat.EMPTY_VALUE)
+                   for key in missing}
+        kvstore.cache.set_many(
+            fetched, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(fetched)
+    return values
+
+
+@timing.phase('thumbnail')
+def attach_thumbnails(posts, geometry=CARD_GEOMETRY):
+    """Проставляет post.thumbnail всем постам страницы сразу.
+
+    Вместо отдельного обращения к хранилищу sorl на каждую карточку
+    адреса и размеры миниатюр читаются пачкой. Если миниатюры нет,
+    post.thumbnail = None, а картинка ставится в очередь.
+    """
+    posts = list(posts)
+    geometry, options = geometry
+    files = {
+        post.pk: thumbnail_file(post.image, geometry, options)
+        for post in posts if post.image
+    }
+    if sorl_compat.is_cached_db(default.kvstore):
+        keys = {pk: sorl_compat.storage_key(file)
+                for pk, file in files.items()}
+        values = _resolve_raw(list(keys.values()))
+        found = {
+            pk: deserialize_image_file(values[key])
+            for pk, key in keys.items()
+            if values[key] != sorl_compat.EMPTY_VALUE
+        }
+    else:
+        found = {pk: default.kvstore.get(file) for pk, file in files.items()}
+    for post in posts:
+        post.thumbnail = found.get(post.pk)
+        if post.image and post.thumbnail is None:
+            schedule(post.image)
+    return posts
+
+
+def generate(name):
+    """Готовит все миниатюры картинки и сбрасывает кэш её постов."""
+    from .models import Post
+    try:
+        image = ImageFile(name, default_storage)
+        for geometry, options in GEOMETRIES:
+            get_thumbnail(image, geometry, **options)
+        for pk in Post.objects.filter(image=name).values_list('pk', flat=True):
+            caching.bump('post', pk)
+        caching.bump(*caching.FEED)
+    except Exception:
+        logger.exception('Не удалось подготовить миниатюры %s', name)
+
+
+def _submit(name):
+    global _executor
+    if not getattr(settings, 'THUMBNAIL_BACKGROUND', True):
+        generate(name)
+        return
+    with _lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'THUMBNAIL_WORKERS', 2),
+                thread_name_prefix='thumbnails',
+            )
+    _executor.submit(_run_in_thread, name)
+
+
+def _run_in_thread(name):
+    try:
+        generate(name)
+    finally:
+        with _lock:
+            _pending.discard(name)
+        connection.close()
+
+
+def schedule(image):
+    """Ставит картинку в очередь после фиксации транзакции."""
+    if image:
+        transaction.on_commit(partial(_submit, image.name))
@@ -1,11 +1,191 @@
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator
+from django.db.models import Q
+
+from .models import Comment
 
 
 POSTS_ON_PAGE: int = 10
+COMMENTS_ON_PAGE: int = 20
+
+NUMBERED = 'numbered'
+KEYSET = 'keyset'
+FEED_ORDERING = ('-created', '-pk')
+COMMENT_ORDERING = ('created', 'pk')
+MIN_INT, MAX_INT = -2 ** 63, 2 ** 63 - 1
+
+
+class KeysetPage:
+    """Страница ленты без COUNT(*) и OFFSET.
+
+    Повторяет ту часть интерфейса django.core.paginator.Page,
+    которой пользуются шаблоны.
+    """
+    is_keyset = True
+
+    def __init__(self, object_list, paginator, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<Keyset page of {len(self)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
 
 
-def get_pages(queryset, request):
+class KeysetPaginator:
+    """Курсорный пагинатор по полям ordering.
+
+    По умолчанию берётся явная сортировка queryset (поля модели или
+    аннотации), иначе created, id. Курсор - непрозрачная строка
+    с ключом сортировки крайней записи страницы. Время выборки
+    не зависит от глубины страницы.
+    """
+
+    def __init__(self, queryset, per_page, ordering=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(
+            ordering or queryset.query.order_by or FEED_ORDERING)
+        self.model = queryset.model
+
+    def _fields(self):
+        annotations = self.queryset.query.annotations
+        for item in self.ordering:
+            name = item.lstrip('-')
+            if name in annotations:
+                field = annotations[name].output_field
+            elif name == 'pk':
+                field = self.model._meta.pk
+            else:
+                field = self.model._meta.get_field(name)
+            yield name, item.startswith('-'), field
+
+    def encode_cursor(self, obj):
+        annotations = self.queryset.query.annotations
+        values = []
+        for name, _, field in self._fields():
+            value = (getattr(obj, name) if name in annotations
+                     else field.value_from_object(obj))
+            values.append(
+                value.isoformat() if hasattr(value, 'isoformat') else value)
+        raw = json.dumps(values, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Возвращает значения ключа сортировки или None для мусора.
+
+        Мусор - всё, что не разобрать в полный ключ: не тот формат,
+        пустые (null) значения, числа вне 64-битного диапазона.
+        """
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            fields = list(self._fields())
+            if not isinstance(values, list) or len(values) != len(fields):
+                return None
+            values = [
+                field.to_python(value)
+                for (_, _, field), value in zip(fields, values)
+            ]
+        except (ValueError, TypeError, OverflowError, ValidationError):
+            return None
+        for value in values:
+            if value is None:
+                return None
+            # Больше не поместится в параметр запроса SQLite
+            if isinstance(value, int) and not MIN_INT <= value <= MAX_INT:
+                return None
+        return values
+
+    def _seek(self, values, backwards):
+        """Условие "строго после курсора" в порядке сортировки."""
+        fields = list(self._fields())
+        condition = Q()
+        equal = {}
+        for (name, descending, _), value in zip(fields, values):
+            lookup = 'lt' if descending != backwards else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        first_name, first_descending, _ = fields[0]
+        bound = 'lte' if first_descending != backwards else 'gte'
+        return Q(**{f'{first_name}__{bound}': values[0]}) & condition
+
+    def page(self, after=None, before=None):
+        backwards = bool(before) and not after
+        values = self.decode_cursor(before if backwards else after or '')
+        if values is None:
+            backwards = False
+        ordering = self.ordering
+        if backwards:
+            ordering = tuple(
+                item[1:] if item.startswith('-') else f'-{item}'
+                for item in ordering
+            )
+        queryset = self.queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, backwards))
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = self.encode_cursor(rows[-1])
+        if rows and has_previous:
+            previous_cursor = self.encode_cursor(rows[0])
+        return KeysetPage(rows, self, next_cursor, previous_cursor)
+
+
+def get_pages(queryset, request, mode=None):
+    """Страница ленты для шаблона.
+
+    mode=NUMBERED - обычный Paginator с номерами страниц (?page=),
+    mode=KEYSET - курсорная страница (?after=/?before=) без COUNT(*).
+    По умолчанию берётся settings.POSTS_PAGINATION.
+    """
+    mode = mode or getattr(settings, 'POSTS_PAGINATION', NUMBERED)
+    if mode == KEYSET:
+        paginator = KeysetPaginator(queryset, POSTS_ON_PAGE)
+        return paginator.page(
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+        )
     paginator = Paginator(queryset, POSTS_ON_PAGE)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     return page_obj
+
+
+def get_comments(post_id, after=None):
+    """Порция комментариев поста от старых к новым после курсора after."""
+    comments = Comment.objects.filter(post_id=post_id).select_related(
+        'author').only('text', 'created', 'post', 'author__username')
+    paginator = KeysetPaginator(comments, COMMENTS_ON_PAGE, COMMENT_ORDERING)
+    return paginator.page(after=after)
@@ -3,25 +3,38 @@ from .models import Post, Group, User, Follow
 from django.contrib.auth.decorators import login_required
 from .forms import PostForm, CommentForm
 from django.shortcuts import redirect
-from .utils import get_pages
-from django.views.decorators.cache import cache_page
+from django.urls import reverse
+from .utils import NUMBERED, get_comments, get_pages
+from . import caching, counters, feeds, search, thumbnails, timeline
+from core.db import write_atomic
+from django.views.decorators.http import condition
+from core.replicas import read_from_replica
 
 
-@cache_page(20)
+@read_from_replica
+@condition(etag_func=caching.feed_etag)
+@caching.cache_feed_page
 def index(request):
-    post_list = Post.objects.all()
+    post_list = Post.objects.for_feed()
     template = 'posts/index.html'
     page_obj = get_pages(post_list, request)
+    caching.attach_card_versions(page_obj)
+    thumbnails.attach_thumbnails(page_obj)
     context = {
         'page_obj': page_obj,
     }
     return render(request, template, context)
 
 
+@read_from_replica
+@condition(etag_func=caching.feed_etag)
+@caching.cache_feed_page
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = Post.objects.filter(group=group)
+    post_list = Post.objects.for_feed().filter(group=group)
     page_obj = get_pages(post_list, request)
+    caching.attach_card_versions(page_obj)
+    thumbnails.attach_thumbnails(page_obj)
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -29,31 +42,97 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@read_from_replica
+@condition(etag_func=caching.profile_etag)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post_list = Post.objects.filter(author=author)
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+    post_list = Post.objects.for_feed().filter(author=author)
     page_obj = get_pages(post_list, request)
+    caching.attach_card_versions(page_obj)
+    thumbnails.attach_thumbnails(page_obj)
     following = (request.user.is_authenticated
                  and Follow.objects.filter(user=request.user,
                                            author=author).exists())
     context = {
         'author': author,
+        'stats': counters.stats_for(author),
         'page_obj': page_obj,
         'following': following,
     }
     return render(request, 'posts/profile.html', context)
 
 
+@condition(etag_func=caching.feed_etag)
+def index_feed(request, fmt):
+    return feeds.stream(request, fmt, 'Последние обновления на сайте',
+                        reverse('posts:index'), Post.objects.for_feed())
+
+
+@condition(etag_func=caching.feed_etag)
+def group_feed(request, slug, fmt):
+    group = get_object_or_404(Group, slug=slug)
+    return feeds.stream(
+        request, fmt, f'Записи группы {group.title}',
+        reverse('posts:group_list', kwargs={'slug': slug}),
+        Post.objects.for_feed().filter(group=group),
+    )
+
+
+@condition(etag_func=caching.profile_etag)
+def profile_feed(request, username, fmt):
+    author = get_object_or_404(User, username=username)
+    return feeds.stream(
+        request, fmt,
+        f'Все посты пользователя {author.get_full_name() or username}',
+        reverse('posts:profile', kwargs={'username': username}),
+        Post.objects.for_feed().filter(author=author),
+    )
+
+
+def post_search(request):
+    query = request.GET.get('q', '').strip()
+    post_ids = search.search_ids(query) if query else []
+    page_obj = get_pages(post_ids, request, mode=NUMBERED)
+    posts = Post.objects.for_feed().in_bulk(page_obj.object_list)
+    page_obj.object_list = [
+        posts[pk] for pk in page_obj.object_list if pk in posts
+    ]
+    caching.attach_card_versions(page_obj)
+    thumbnails.attach_thumbnails(page_obj)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@read_from_replica
+@condition(etag_func=caching.feed_etag)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), id=post_id
+    )
     form = CommentForm()
     context = {
         'form': form,
         'post': post,
+        'author_stats': counters.stats_for(post.author),
+        'comments': get_comments(post.pk),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_comments(request, post_id):
+    post = get_object_or_404(Post.objects.only('pk'), id=post_id)
+    context = {
+        'post': post,
+        'comments': get_comments(post.pk, after=request.GET.get('after')),
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
 @login_required
 def post_create(request):
     is_edit = False
@@ -61,9 +140,10 @@ def post_create(request):
                     files=request.FILES or None
                     )
     if form.is_valid():
-        form = form.save(commit=False)
-        form.author = request.user
-        form.save()
+        with write_atomic():
+            form = form.save(commit=False)
+            form.author = request.user
+            form.save()
         return redirect('posts:profile', username=request.user)
     template_name = 'posts/create_post.html'
     return render(request, template_name, {'form': form, 'is_edit': is_edit})
@@ -79,7 +159,10 @@ def post_edit(request, post_id):
                     files=request.FILES or None,
                     instance=post)
     if form.is_valid():
-        post.save()
+        # Только поля формы: счётчик комментариев мог измениться
+        # после загрузки поста
+        form.save(commit=False)
+        post.save(update_fields=form._meta.fields)
         return redirect('posts:post_detail', post_id=post_id)
     template_name = 'posts/create_post.html'
     return render(request, template_name,
@@ -92,19 +175,21 @@ def add_comment(request, post_id):
     form = CommentForm(request.POST or None)
     post = get_object_or_404(Post, id=post_id)
     if form.is_valid():
-        comment = form.save(commit=False)
-        comment.author = request.user
-        comment.post = post
-        comment.save()
+        with write_atomic():
+            comment = form.save(commit=False)
+            comment.author = request.user
+            comment.post = post
+            comment.save()
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
+@condition(etag_func=caching.follow_etag)
 def follow_index(request):
-    posts = Post.objects.filter(
-        author__following__user=request.user
-    )
+    posts = timeline.feed_for(request.user).for_feed()
     page_obj = get_pages(posts, request)
+    caching.attach_card_versions(page_obj)
+    thumbnails.attach_thumbnails(page_obj)
     context = {
         'page_obj': page_obj,
     }
@@ -112,6 +197,7 @@ def follow_index(request):
 
 
 @login_required
+@write_atomic
 def profile_follow(request, username):
     if request.user != get_object_or_404(User, username=username):
         Follow.objects.get_or_create(
@@ -122,6 +208,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@write_atomic
 def profile_unfollow(request, username):
     qs = Follow.objects.filter(user=request.user, author__username=username)
     if qs.exists():
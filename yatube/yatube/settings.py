@@ -52,11 +52,16 @@ INSTALLED_APPS = [
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
+    'core.slowlog.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'core.replicas.ReplicaMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.timing.ServerTimingMiddleware',
+    'core.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -69,7 +74,7 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.timing.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -90,12 +95,30 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# core.db - SQLite с WAL, BEGIN IMMEDIATE и повтором занятого BEGIN
+# (core/db/base.py); сравнение со стандартным - manage.py sqlite_benchmark
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.db',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        'CONN_MAX_AGE': 60,
+    },
+    # Копия default для чтения лент (core/replicas.py), обновляется
+    # manage.py sync_replica
+    'replica': {
+        'ENGINE': 'core.db',
+        'NAME': os.path.join(BASE_DIR, 'db.replica.sqlite3'),
+        'CONN_MAX_AGE': 60,
+        'TEST': {'MIRROR': 'default'},
+    },
 }
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+DATABASE_REPLICAS = ['replica']
+# Сколько секунд после записи браузер читает только из default
+REPLICA_PIN_SECONDS = 10
+# На сколько секунд реплика может отставать от default для браузеров,
+# которые сами не писали
+REPLICA_MAX_LAG = 5
 
 
 # Password validation
@@ -143,8 +166,57 @@ LOGIN_REDIRECT_URL = 'posts:index'
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
+# Общий для всех процессов кэш в SQLite-файле (core/cache.py)
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_SIZE': 128 * 1024 * 1024,
+        },
     }
 }
+
+# Тесты уводят файлы кэша, метрик и журналов во временный каталог
+TEST_RUNNER = 'core.testing.DiscoverRunner'
+
+# Режим пагинации лент: 'numbered' (?page=) или 'keyset' (?after=/?before=)
+POSTS_PAGINATION = 'numbered'
+
+# Авторы с большим числом подписчиков читаются в ленту при открытии,
+# а не раскладываются по лентам при публикации
+TIMELINE_FANOUT_LIMIT = 1000
+
+# Страницы лент сбрасываются версией при записи, а не по таймауту
+FEED_CACHE_TIMEOUT = 60 * 60 * 6
+
+# Миниатюры картинок готовятся после сохранения поста в фоновых потоках
+THUMBNAIL_BACKGROUND = True
+THUMBNAIL_WORKERS = 2
+
+# Метрики ответов по представлениям (core/metrics.py), общие для
+# всех процессов. Страница /metrics доступна staff, адресам
+# METRICS_ALLOWED_IPS и запросам с заголовком
+# Authorization: Bearer <METRICS_TOKEN>; по умолчанию - только staff
+METRICS_PATH = os.path.join(BASE_DIR, 'cache', 'metrics.sqlite3')
+METRICS_FLUSH_INTERVAL = 1
+METRICS_ALLOWED_IPS = []
+METRICS_TOKEN = ''
+
+# Заголовок Server-Timing (core/timing.py): время SQL, шаблонов,
+# миниатюр и кэша; с SERVER_TIMING_FOOTER - ещё и подвал для staff
+SERVER_TIMING = False
+SERVER_TIMING_FOOTER = False
+
+# Профили cProfile отдельных запросов (core/profiling.py): для staff
+# по ?profile, по заголовку X-Profile с токеном из profile_token
+# или для доли PROFILING_SAMPLE_RATE всех запросов
+PROFILING_DIR = os.path.join(BASE_DIR, 'cache', 'profiles')
+PROFILING_KEEP = 200
+PROFILING_SAMPLE_RATE = 0
+PROFILING_TOKEN_MAX_AGE = 60 * 60
+
+# Журнал медленных SQL-запросов с планами (core/slowlog.py): отпечатки,
+# занявшие за ответ не меньше порога в мс; None - выключено
+SLOW_QUERY_THRESHOLD = 100
+SLOW_QUERY_PATH = os.path.join(BASE_DIR, 'cache', 'slow_queries.sqlite3')